@@ -13,3 +13,4 @@ app.conf.update(timezone='Asia/Kolkata')
 
 app.config_from_object(settings, namespace='CELERY')
 
+app.autodiscover_tasks()
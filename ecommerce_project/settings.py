@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'django.middleware.gzip.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +97,11 @@ CACHES = {
         "LOCATION": REDIS_URL, 
         "OPTIONS":{
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # listing rows are stored column by column, values of 1KB and
+            # up are compressed (lz4 if installed, else zlib)
+            "SERIALIZER": "shop_management.cache_serializers.ColumnarPickleSerializer",
+            "COMPRESSOR": "shop_management.cache_serializers.ThresholdCompressor",
+            "COMPRESS_MIN_LENGTH": 1024,
         },
         "KEY_PREFIX": "ecommerce_project"
         }
@@ -162,6 +168,37 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_RESULT_SERIALZER = 'json'
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/kolkata'
+# run tasks inline (no broker/worker needed) for local development and tests
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() in ('1', 'true', 'yes')
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_BEAT_SCHEDULE = {
+    'process-pending-orders': {
+        'task': 'shop_management.tasks.process_pending_orders',
+        'schedule': 300,
+    },
+}
+
+# one loyalty point per this much spent on an order
+LOYALTY_POINT_VALUE = 100
+
+# fetch_responses/ batches: size cap, sub-requests in flight, and deadlines (seconds)
+BATCH_MAX_REQUESTS = 100
+BATCH_CONCURRENCY = 8
+BATCH_REQUEST_TIMEOUT = 10
+BATCH_TIMEOUT = 30
+
+# timed_response serializer: 'auto' (orjson if installed), 'orjson', 'stdlib' or 'django'
+JSON_SERIALIZER = 'auto'
+
+# encodings for cached listing bodies in order of preference, br and zstd
+# need the brotli / zstandard packages and are skipped without them
+RESPONSE_ENCODINGS = ('br', 'zstd', 'gzip')
+
+# per-process L1 in front of Redis for hot catalogue reads (seconds); cache
+# generations are re-checked in Redis at most every CHECK_INTERVAL
+CACHE_L1_TTL = 30
+CACHE_L1_MAX_ENTRIES = 2000
+CACHE_GENERATION_CHECK_INTERVAL = 0.5
 
 # logging Configuration
 
@@ -1,41 +1,58 @@
-from django.utils import timezone
-from .models import CustomSession
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .session_cache import aresolve_session, resolve_session, principal_instance
+
+
+def _session_ids(request):
+    cookies = request.COOKIES
+    shop_session_id = cookies.get("SHOPKEEPER_SESSIONID")
+    return (
+        cookies.get("SUPERUSER_SESSIONID"),
+        shop_session_id,
+        None if shop_session_id else cookies.get("CUSTOMER_SESSIONID"),
+    )
+
+
+def _attach(request, superuser, shopkeeper, customer):
+    request.shopkeeper = None
+    request.customer = None
+
+    if superuser and superuser['role'] == 'superuser':
+        user = principal_instance(superuser)
+        request.user = user
+
+        async def auser():
+            return user
+        request.auser = auser
+
+    if shopkeeper and shopkeeper['role'] == 'shopkeeper':
+        request.shopkeeper = principal_instance(shopkeeper)
+    elif customer and customer['role'] == 'customer':
+        request.customer = principal_instance(customer)
+
 
 class CustomSessionMiddleware:
+    # runs natively under both WSGI and ASGI, so async views are not
+    # pushed through a thread just to resolve the session
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        print('\nCookies from the browser:\n',request.COOKIES)
-        request.shopkeeper = None
-        request.customer = None
-
-        shop_session_id = request.COOKIES.get("SHOPKEEPER_SESSIONID")
-        cust_session_id = request.COOKIES.get("CUSTOMER_SESSIONID")
-        super_session_id = request.COOKIES.get("SUPERUSER_SESSIONID")
-        
-        if super_session_id:
-            try:
-                session = CustomSession.objects.get(session_id = super_session_id)
-                if session.expires_at >= timezone.now() and session.user:
-                    request.user = session.user
-            except CustomSession.DoesNotExist:
-                pass
-            
-        if shop_session_id:
-            try:
-                session = CustomSession.objects.get(session_id=shop_session_id)
-                if session.expires_at >= timezone.now() and session.shopkeeper:
-                    request.shopkeeper = session.shopkeeper
-            except CustomSession.DoesNotExist:
-                pass
-
-        elif cust_session_id:
-            try:
-                session = CustomSession.objects.get(session_id=cust_session_id)
-                if session.expires_at >= timezone.now() and session.customer:
-                    request.customer = session.customer
-            except CustomSession.DoesNotExist:
-                pass
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
 
+        _attach(request, *[
+            resolve_session(session_id) if session_id else None for session_id in _session_ids(request)
+        ])
         return self.get_response(request)
+
+    async def __acall__(self, request):
+        _attach(request, *[
+            await aresolve_session(session_id) if session_id else None for session_id in _session_ids(request)
+        ])
+        return await self.get_response(request)
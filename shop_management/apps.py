@@ -3,4 +3,6 @@ from django.apps import AppConfig
 class ShopManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop_management'
-    
\ No newline at end of file
+
+    def ready(self):
+        from . import signals  # noqa: F401
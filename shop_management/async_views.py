@@ -0,0 +1,89 @@
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from shop_management.helpers import timed_response, _authorize_shopkeeper, _authorize_customer, _aauthorize_superuser
+from shop_management.listings import (
+    arun_listing, search_listing, product_listing, category_listing,
+    my_orders_listing, recent_orders_listing, orders_today_listing
+)
+
+# Async twins of the read-only listing views, for ASGI (uvicorn) workers.
+# Request parsing, queries and responses come from listings.py so both
+# versions behave the same; these only swap in the async ORM and cache API.
+# Django still runs the queries and the cache backend's calls in its own
+# executor, but the view, the middleware and a warm session lookup stay on
+# the event loop instead of occupying a thread for the whole request.
+
+
+@csrf_exempt
+@timed_response
+async def search_product(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_shopkeeper(request) or _authorize_customer(request) or await _aauthorize_superuser(request)
+    if not user:
+        return JsonResponse({'error': 'You should be an authorized user'}, status=401)
+
+    return await arun_listing(search_listing(request), request)
+
+
+@csrf_exempt
+@timed_response
+async def list_products(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_shopkeeper(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return await arun_listing(product_listing(request, user), request)
+
+
+@csrf_exempt
+@timed_response
+async def list_categories(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    return await arun_listing(category_listing(request), request)
+
+
+@csrf_exempt
+@timed_response
+async def my_orders(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return await arun_listing(my_orders_listing(request, user), request)
+
+
+@csrf_exempt
+@timed_response
+async def recent_orders(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return await arun_listing(recent_orders_listing(request, user), request)
+
+
+@csrf_exempt
+@timed_response
+async def orders_today(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return await arun_listing(orders_today_listing(request, user), request)
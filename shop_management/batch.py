@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import math
+import threading
+from operator import itemgetter
+from time import monotonic
+from urllib.parse import urlsplit
+
+import httpx # type: ignore
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+# Sub-requests of fetch_multiple_requests that point at this server are run
+# in-process: the URL is resolved with Django's resolver and the view is
+# called with a synthetic request that shares the caller's already resolved
+# session, so there is no loopback HTTP call, no second middleware pass and
+# no extra worker tied up. Other hosts go through one shared httpx pool.
+MAX_REQUESTS = getattr(settings, 'BATCH_MAX_REQUESTS', 100)
+CONCURRENCY = getattr(settings, 'BATCH_CONCURRENCY', 8)
+REQUEST_TIMEOUT = getattr(settings, 'BATCH_REQUEST_TIMEOUT', 10)
+BATCH_TIMEOUT = getattr(settings, 'BATCH_TIMEOUT', 30)
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+
+# attributes set by the middleware that sub-requests inherit from the caller
+INHERITED_ATTRIBUTES = ('shopkeeper', 'customer', 'user', 'auser', 'session')
+
+# the batch's own validators and encodings must not turn sub-responses into
+# empty 304s or compressed bodies that cannot be embedded
+DROPPED_HEADERS = (
+    'HTTP_IF_NONE_MATCH', 'HTTP_IF_MATCH', 'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE',
+    'HTTP_ACCEPT_ENCODING',
+)
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_requests(requests_list):
+    """Validates the batch body, returns [(method, url, params, body, timeout)]."""
+    if not isinstance(requests_list, list) or not requests_list:
+        raise BatchError('No requests provided')
+    if len(requests_list) > MAX_REQUESTS:
+        raise BatchError(f'At most {MAX_REQUESTS} requests can be batched')
+
+    parsed = []
+    for req in requests_list:
+        if not isinstance(req, dict) or "method" not in req or "url" not in req:
+            raise BatchError("Each request must have 'method' and 'url'")
+        try:
+            timeout = float(req.get('timeout', REQUEST_TIMEOUT))
+        except (TypeError, ValueError):
+            timeout = None
+        if timeout is None or not math.isfinite(timeout) or timeout <= 0:
+            raise BatchError('timeout must be a positive number of seconds')
+        # a sub-request may ask for a shorter timeout, never a longer one
+        timeout = min(timeout, REQUEST_TIMEOUT)
+        parsed.append((str(req['method']).upper(), str(req['url']), req.get('params'), req.get('body'), timeout))
+    return parsed
+
+
+def is_local(request, url):
+    parts = urlsplit(url)
+    return not parts.netloc or parts.netloc == request.get_host()
+
+
+def build_request(request, method, url, params=None, body=None):
+    parts = urlsplit(url)
+    query = QueryDict(parts.query, mutable=True)
+    for key, value in (params or {}).items():
+        query[key] = value
+    raw_body = json.dumps(body).encode() if body is not None else b''
+
+    sub = HttpRequest()
+    sub.method = method
+    sub.path = sub.path_info = parts.path or '/'
+    sub.META = {
+        **{key: value for key, value in request.META.items() if key not in DROPPED_HEADERS},
+        'REQUEST_METHOD': method,
+        'PATH_INFO': sub.path,
+        'QUERY_STRING': query.urlencode(),
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(raw_body)),
+    }
+    sub.GET = query
+    sub.GET._mutable = False
+    sub.COOKIES = request.COOKIES
+    sub._body = raw_body
+    sub._stream = None
+    for name in INHERITED_ATTRIBUTES:
+        if hasattr(request, name):
+            setattr(sub, name, getattr(request, name))
+    return sub
+
+
+def _run_sync_view(view, request, args, kwargs):
+    # runs on an executor thread: its database connection is closed (or
+    # kept, per CONN_MAX_AGE) the way request_finished would for a request
+    try:
+        return view(request, *args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def _decode(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content.decode(errors='replace')
+
+
+async def dispatch(request, method, url, params=None, body=None):
+    """Runs one sub-request in-process, returns (status, decoded body)."""
+    sub = build_request(request, method, url, params, body)
+    try:
+        match = resolve(sub.path_info)
+    except Resolver404:
+        return 404, {'error': 'Not found'}
+    if getattr(match.func, 'batch_exempt', False):
+        return 400, {'error': 'This endpoint cannot be batched'}
+
+    try:
+        if iscoroutinefunction(match.func):
+            response = await match.func(sub, *match.args, **match.kwargs)
+        else:
+            response = await sync_to_async(_run_sync_view, thread_sensitive=False)(
+                match.func, sub, match.args, match.kwargs
+            )
+    except Http404:
+        return 404, {'error': 'Not found'}
+
+    if getattr(response, 'streaming', False):
+        return 400, {'error': 'Streaming responses cannot be batched'}
+    return response.status_code, _decode(response.content)
+
+
+class SharedHTTPClient:
+    """
+    One keep-alive httpx.AsyncClient per process.
+
+    An AsyncClient belongs to the event loop it first ran on, and under WSGI
+    every async view gets a fresh loop, so the client lives on its own
+    daemon loop thread and callers hand their requests over to it.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self._loop = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='batch-http', daemon=True).start()
+                self._client = httpx.AsyncClient(**self.options)
+                self._loop = loop
+        return self._loop
+
+    async def request(self, method, url, **kwargs):
+        loop = self._loop or self._start()
+        future = asyncio.run_coroutine_threadsafe(self._client.request(method, url, **kwargs), loop)
+        # cancelling the caller (timeouts) cancels the request on the pool loop too
+        return await asyncio.wrap_future(future)
+
+
+http_client = SharedHTTPClient(
+    limits=httpx.Limits(max_connections=CONCURRENCY * 4, max_keepalive_connections=CONCURRENCY * 2),
+    timeout=REQUEST_TIMEOUT,
+)
+
+
+async def fetch(method, url, params=None, body=None, cookies=None):
+    """Sends one sub-request to another host over the shared pool."""
+    if method != "GET" and not body and params:
+        return 400, {'error': f"{method} requests require a body"}
+    res = await http_client.request(
+        method, url, params=params, json=body if method != "GET" else None, cookies=cookies
+    )
+    return res.status_code, _decode(res.content)
+
+
+def _entry(index, method, url, status, data):
+    return {'index': index, 'method': method, 'url': url, 'status': status, 'data': data}
+
+
+async def iter_batch(request, requests_list, in_process=True, cookies=None):
+    """
+    Runs parsed sub-requests with at most CONCURRENCY in flight, each bounded
+    by its timeout and the whole batch by BATCH_TIMEOUT, and yields one
+    {index, method, url, status, data} entry per request as it finishes.
+    Failures are reported per entry.
+    """
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+    deadline = monotonic() + BATCH_TIMEOUT
+
+    async def run(index, method, url, params, body, timeout):
+        async with semaphore:
+            if method not in METHODS:
+                return _entry(index, method, url, 405, {'error': f"Method {method} not supported"})
+            if in_process and is_local(request, url):
+                call = dispatch(request, method, url, params, body)
+            else:
+                call = fetch(method, url, params, body, cookies)
+            try:
+                status, data = await asyncio.wait_for(call, timeout=min(timeout, max(deadline - monotonic(), 0)))
+            except asyncio.TimeoutError:
+                # an in-process sync view keeps running on its thread, its result is dropped
+                status, data = 504, {'error': 'Timed out'}
+            except httpx.HTTPError as exc:
+                status, data = 502, {'error': f'{type(exc).__name__} while calling {url}'}
+            except Exception:
+                logger.exception('Batched %s %s failed', method, url)
+                status, data = 500, {'error': 'Internal server error'}
+            return _entry(index, method, url, status, data)
+
+    # finished entries are dropped from here as soon as they are yielded
+    pending = {index: asyncio.ensure_future(run(index, *req)) for index, req in enumerate(requests_list)}
+    try:
+        for next_done in asyncio.as_completed(list(pending.values()), timeout=max(deadline - monotonic(), 0)):
+            entry = await next_done
+            del pending[entry['index']]
+            yield entry
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        # also runs when a streaming client disconnects mid-batch
+        for task in pending.values():
+            task.cancel()
+
+    # still running, or queued for a semaphore slot, when the deadline passed
+    for index in sorted(pending):
+        method, url = requests_list[index][:2]
+        yield _entry(index, method, url, 504, {'error': 'Timed out'})
+
+
+async def run_batch(request, requests_list, in_process=True, cookies=None):
+    """Collects iter_batch into a list in request order."""
+    results = [entry async for entry in iter_batch(request, requests_list, in_process, cookies)]
+    results.sort(key=itemgetter('index'))
+    return results
+
+
+async def ndjson_lines(entries):
+    async for entry in entries:
+        yield json.dumps(entry) + '\n'
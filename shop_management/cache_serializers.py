@@ -0,0 +1,119 @@
+import pickle
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+from itertools import repeat
+
+from django_redis.compressors.base import BaseCompressor # type: ignore
+from django_redis.exceptions import CompressorError # type: ignore
+from django_redis.serializers.pickle import PickleSerializer # type: ignore
+
+try:
+    import lz4.frame # type: ignore
+except ImportError:
+    lz4 = None
+
+# Value format for the default (django_redis) cache, set in
+# CACHES['default']['OPTIONS']. Listing pages are lists of .values() rows
+# sharing the same keys; plain pickle repeats the keys in every row and
+# reduces every Decimal and datetime as a separate object. Such lists are
+# stored column by column instead: keys once, Decimals as strings, UTC
+# datetimes as timestamps. Unpickling rebuilds the same list of dicts, and
+# entries written by the stock PickleSerializer still load.
+MIN_ROWS = 8
+MAX_DEPTH = 3
+
+LZ4_MAGIC = b'\x04\x22\x4d\x18'
+
+
+def unpack_rows(keys, codes, columns):
+    values = []
+    for code, column in zip(codes, columns):
+        if code == 'D':
+            column = map(Decimal, column)
+        elif code == 'T':
+            column = map(datetime.fromtimestamp, column, repeat(timezone.utc))
+        values.append(column)
+    return list(map(dict, map(zip, repeat(keys), zip(*values))))
+
+
+class _Rows(list):
+    def __reduce__(self):
+        keys = tuple(self[0])
+        codes = []
+        columns = []
+        for key in keys:
+            column = [row[key] for row in self]
+            kinds = set(map(type, column))
+            if kinds == {Decimal}:
+                codes.append('D')
+                column = list(map(str, column))
+            elif kinds == {datetime} and all(value.tzinfo is timezone.utc for value in column):
+                codes.append('T')
+                column = [value.timestamp() for value in column]
+            else:
+                codes.append('O')
+            columns.append(column)
+        return unpack_rows, (keys, ''.join(codes), columns)
+
+
+def _is_rows(value):
+    if len(value) < MIN_ROWS or type(value[0]) is not dict:
+        return False
+    keys = value[0].keys()
+    return all(type(row) is dict and row.keys() == keys for row in value)
+
+
+def _pack(value, depth):
+    # walks tuples (CachedEntry, (items, total_pages, total_count)) and dict
+    # values a few levels down, swapping row lists for _Rows
+    if depth == 0:
+        return value
+    if type(value) is list:
+        return _Rows(value) if _is_rows(value) else value
+    if isinstance(value, tuple):
+        packed = [_pack(item, depth - 1) for item in value]
+        if all(a is b for a, b in zip(packed, value)):
+            return value
+        return type(value)(*packed) if hasattr(value, '_fields') else tuple(packed)
+    if type(value) is dict:
+        packed = {key: _pack(item, depth - 1) for key, item in value.items()}
+        if all(packed[key] is item for key, item in value.items()):
+            return value
+        return packed
+    return value
+
+
+class ColumnarPickleSerializer(PickleSerializer):
+    def dumps(self, value):
+        return pickle.dumps(_pack(value, MAX_DEPTH), self._pickle_version)
+
+
+class ThresholdCompressor(BaseCompressor):
+    """
+    lz4 when installed, zlib otherwise, for values of at least
+    COMPRESS_MIN_LENGTH bytes. Small values, and values that do not shrink
+    (already compressed response bodies), are stored raw.
+    """
+
+    def __init__(self, options):
+        super().__init__(options)
+        self.min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+
+    def compress(self, value):
+        if len(value) < self.min_length:
+            return value
+        compressed = lz4.frame.compress(value) if lz4 is not None else zlib.compress(value, 6)
+        return compressed if len(compressed) < len(value) else value
+
+    def decompress(self, value):
+        # raw pickles start with b'\x80', so neither format matches them and
+        # django_redis falls back to the raw value on CompressorError
+        if value[:4] == LZ4_MAGIC:
+            if lz4 is None:
+                raise CompressorError('lz4 is not installed')
+            return lz4.frame.decompress(value)
+        try:
+            return zlib.decompress(value)
+        except zlib.error as e:
+            raise CompressorError from e
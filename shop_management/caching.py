@@ -0,0 +1,433 @@
+import asyncio
+import logging
+import math
+import random
+import threading
+import uuid
+import weakref
+from collections import Counter, namedtuple
+from concurrent.futures import Future
+from time import sleep, time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .lru import TTLLRUCache
+
+logger = logging.getLogger(__name__)
+
+# View cache keys embed the current generation of every entity set they were
+# built from. Writes bump the generation, which makes the old keys
+# unreachable (they just age out), so no SCAN/DELETE is needed and the
+# entries can live for settings.CACHE_TTL.
+
+CATALOGUE = 'catalogue'
+PROMOTIONS = 'promotions'
+
+# Stampede protection for cached_call()
+STALE_GRACE = getattr(settings, 'CACHE_STALE_GRACE', 120)
+EARLY_REFRESH_BETA = getattr(settings, 'CACHE_EARLY_REFRESH_BETA', 1.0)
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+# compare-and-delete in one step, a lock that expired and was taken by
+# another worker between a GET and a DEL would otherwise be dropped
+RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+# Per-process L1 in front of the shared cache for hot reads (callers opt in
+# with local=True). Versioned keys never change meaning, so an L1 entry only
+# has to expire. Generations are what changes: every process keeps them for
+# GENERATION_CHECK_INTERVAL seconds, which is how long a bump made by another
+# process can take to be seen here; bump() drops this process's copy at once.
+L1_TTL = getattr(settings, 'CACHE_L1_TTL', 30)
+GENERATION_CHECK_INTERVAL = getattr(settings, 'CACHE_GENERATION_CHECK_INTERVAL', 0.5)
+
+CachedEntry = namedtuple('CachedEntry', ['value', 'expires_at', 'build_time'])
+
+_l1 = TTLLRUCache(getattr(settings, 'CACHE_L1_MAX_ENTRIES', 2000))
+_l1_generations = TTLLRUCache(10000)
+# hit/miss counters per tier for this process, see cache_stats()
+_stats = Counter()
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+# async views single-flight per event loop
+_ainflight = weakref.WeakKeyDictionary()
+
+
+def shopkeeper_products(shopkeeper_id):
+    return f'products_shopkeeper_{shopkeeper_id}'
+
+
+def customer_orders(customer_id):
+    return f'orders_customer_{customer_id}'
+
+
+def _generation_key(namespace):
+    return f'generation_{namespace}'
+
+
+def _seed():
+    # counters are (re)started from the clock, so an evicted counter never
+    # falls back to a generation that old keys were written with
+    return int(time() * 1000)
+
+
+def _count(tier, hit):
+    _stats[f"{tier}_{'hits' if hit else 'misses'}"] += 1
+
+
+def cache_stats():
+    return {
+        **{f'{tier}_{result}': _stats[f'{tier}_{result}']
+           for tier in ('l1', 'l2', 'generation_l1') for result in ('hits', 'misses')},
+        'l1_entries': len(_l1),
+        'generation_entries': len(_l1_generations),
+    }
+
+
+def local_get(key):
+    value = _l1.get(key)
+    _count('l1', value is not None)
+    return value
+
+
+def local_set(key, value, ttl):
+    _l1.set(key, value, min(ttl, L1_TTL))
+
+
+def shared_get(key):
+    value = cache.get(key)
+    _count('l2', value is not None)
+    return value
+
+
+async def ashared_get(key):
+    value = await cache.aget(key)
+    _count('l2', value is not None)
+    return value
+
+
+def _shared_generations(namespaces):
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+
+    missing = [key for key in keys if key not in found]
+    if missing:
+        seed = _seed()
+        for key in missing:
+            cache.add(key, seed, timeout=None)
+        found.update(cache.get_many(missing))
+
+    return [found[key] for key in keys]
+
+
+async def _ashared_generations(namespaces):
+    keys = [_generation_key(namespace) for namespace in namespaces]
+    found = await cache.aget_many(keys)
+
+    missing = [key for key in keys if key not in found]
+    if missing:
+        seed = _seed()
+        for key in missing:
+            await cache.aadd(key, seed, timeout=None)
+        found.update(await cache.aget_many(missing))
+
+    return [found[key] for key in keys]
+
+
+def _local_generations(namespaces):
+    found = {}
+    for namespace in namespaces:
+        generation = _l1_generations.get(namespace)
+        _count('generation_l1', generation is not None)
+        if generation is not None:
+            found[namespace] = generation
+    return found
+
+
+def _remember_generations(found):
+    for namespace, generation in found.items():
+        _l1_generations.set(namespace, generation, GENERATION_CHECK_INTERVAL)
+
+
+def generations(*namespaces):
+    found = _local_generations(namespaces)
+    missing = [namespace for namespace in namespaces if namespace not in found]
+    if missing:
+        shared = dict(zip(missing, _shared_generations(missing)))
+        _remember_generations(shared)
+        found.update(shared)
+    return [found[namespace] for namespace in namespaces]
+
+
+async def agenerations(*namespaces):
+    found = _local_generations(namespaces)
+    missing = [namespace for namespace in namespaces if namespace not in found]
+    if missing:
+        shared = dict(zip(missing, await _ashared_generations(missing)))
+        _remember_generations(shared)
+        found.update(shared)
+    return [found[namespace] for namespace in namespaces]
+
+
+def _versioned(base, generation_values):
+    return f"{base}_gen_{'.'.join(str(generation) for generation in generation_values)}"
+
+
+def versioned_key(base, *namespaces):
+    return _versioned(base, generations(*namespaces))
+
+
+async def aversioned_key(base, *namespaces):
+    return _versioned(base, await agenerations(*namespaces))
+
+
+def bump(*namespaces):
+    for namespace in set(namespaces):
+        key = _generation_key(namespace)
+        if not cache.add(key, _seed(), timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, _seed(), timeout=None)
+        _l1_generations.delete(namespace)
+
+
+def _single_flight(key, compute):
+    # one computation per key per process, other threads wait for its result
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        value = compute()
+        future.set_result(value)
+        return value
+    except BaseException as exc:
+        future.set_exception(exc)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _remember(key, entry):
+    # a local copy never outlives the entry's own expiry, so the early
+    # refresh and the stale grace keep working off the shared cache
+    local_set(key, entry, entry.expires_at - time())
+
+
+def _get_entry(key, local):
+    entry = local_get(key) if local else None
+    if entry is None:
+        entry = shared_get(key)
+        if local and isinstance(entry, CachedEntry):
+            _remember(key, entry)
+    return entry
+
+
+def _store(key, producer, timeout, local=False):
+    started = time()
+    value = producer()
+    finished = time()
+    entry = CachedEntry(value, finished + timeout, finished - started)
+    cache.set(key, entry, timeout=timeout + STALE_GRACE)
+    if local:
+        _remember(key, entry)
+    return entry
+
+
+def _acquire(lock_key):
+    # the lock holds a token of its own, so a worker whose lock expired
+    # while it was building cannot release the next holder's lock
+    token = uuid.uuid4().hex
+    return token if cache.add(lock_key, token, LOCK_TIMEOUT) else None
+
+
+def _release(lock_key, token):
+    client = getattr(cache, 'client', None)
+    if hasattr(client, 'get_client'):
+        # django_redis: the token is compared as stored, serialized
+        client.get_client(write=True).eval(RELEASE_SCRIPT, 1, client.make_key(lock_key), client.encode(token))
+    elif cache.get(lock_key) == token:
+        # other backends (LocMem in development) have no atomic compare-and-delete
+        cache.delete(lock_key)
+
+
+def _refresh(key, producer, timeout, lock_key, token, local=False):
+    try:
+        return _store(key, producer, timeout, local)
+    finally:
+        _release(lock_key, token)
+
+
+def _fill(key, producer, timeout, lock_key, local=False):
+    token = _acquire(lock_key)
+    if token is not None:
+        return _refresh(key, producer, timeout, lock_key, token, local)
+
+    # another worker is building it, wait for its result before giving up
+    deadline = time() + LOCK_WAIT
+    while time() < deadline:
+        sleep(LOCK_POLL_INTERVAL)
+        entry = cache.get(key)
+        if _is_fresh(entry):
+            return entry
+    return _store(key, producer, timeout, local)
+
+
+def _is_fresh(entry):
+    return isinstance(entry, CachedEntry) and time() < entry.expires_at
+
+
+def _should_refresh(entry):
+    early = entry.build_time * EARLY_REFRESH_BETA * -math.log(1.0 - random.random())
+    return time() + early >= entry.expires_at
+
+
+def cached_entry(key, producer, timeout, local=False, stale=True):
+    """
+    Stampede-safe replacement for a cache.get / cache.set pair.
+
+    Entries are refreshed a little before they expire, with a probability
+    that grows with how long they took to build. Only the worker holding the
+    key's lock rebuilds. Until it finishes, everyone else keeps getting the
+    previous value for up to STALE_GRACE seconds, and a refresh that fails
+    is logged and answered with the previous value too. Cold misses are
+    single-flighted per process and wait on the lock across processes.
+    With local=True entries are also kept in this process's L1. With
+    stale=False (values that must change exactly at expires_at, like
+    prices) an expired entry is a miss and is never served.
+
+    Returns the CachedEntry the value came from: its expires_at is in the
+    past when a previous value was served.
+    """
+    lock_key = f'{key}_lock'
+    entry = _get_entry(key, local)
+
+    if isinstance(entry, CachedEntry) and (stale or _is_fresh(entry)):
+        if not _should_refresh(entry):
+            return entry
+        token = None if key in _inflight else _acquire(lock_key)
+        if token is None:
+            return entry
+        try:
+            return _single_flight(key, lambda: _refresh(key, producer, timeout, lock_key, token, local))
+        except Exception:
+            logger.exception('Refreshing %s failed, serving the previous value', key)
+            return entry
+
+    return _single_flight(key, lambda: _fill(key, producer, timeout, lock_key, local))
+
+
+def cached_call(key, producer, timeout, local=False, stale=True):
+    """The value of cached_entry(), for callers that do not care how fresh it is."""
+    return cached_entry(key, producer, timeout, local, stale).value
+
+
+# async twins of the functions above, for the async views. The producer is
+# an async callable; entries are shared with the sync path.
+
+async def _asingle_flight(key, compute):
+    inflight = _ainflight.setdefault(asyncio.get_running_loop(), {})
+    future = inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        value = await compute()
+        future.set_result(value)
+        return value
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except BaseException as exc:
+        future.set_exception(exc)
+        # nobody may be waiting, mark the exception as retrieved
+        future.exception()
+        raise
+    finally:
+        del inflight[key]
+
+
+async def _aget_entry(key, local):
+    entry = local_get(key) if local else None
+    if entry is None:
+        entry = await ashared_get(key)
+        if local and isinstance(entry, CachedEntry):
+            _remember(key, entry)
+    return entry
+
+
+async def _astore(key, producer, timeout, local=False):
+    started = time()
+    value = await producer()
+    finished = time()
+    entry = CachedEntry(value, finished + timeout, finished - started)
+    await cache.aset(key, entry, timeout=timeout + STALE_GRACE)
+    if local:
+        _remember(key, entry)
+    return entry
+
+
+async def _aacquire(lock_key):
+    token = uuid.uuid4().hex
+    return token if await cache.aadd(lock_key, token, LOCK_TIMEOUT) else None
+
+
+async def _arelease(lock_key, token):
+    await sync_to_async(_release)(lock_key, token)
+
+
+async def _arefresh(key, producer, timeout, lock_key, token, local=False):
+    try:
+        return await _astore(key, producer, timeout, local)
+    finally:
+        await _arelease(lock_key, token)
+
+
+async def _afill(key, producer, timeout, lock_key, local=False):
+    token = await _aacquire(lock_key)
+    if token is not None:
+        return await _arefresh(key, producer, timeout, lock_key, token, local)
+
+    deadline = time() + LOCK_WAIT
+    while time() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if _is_fresh(entry):
+            return entry
+    return await _astore(key, producer, timeout, local)
+
+
+async def acached_entry(key, producer, timeout, local=False, stale=True):
+    """cached_entry for async views, same refresh and locking rules."""
+    lock_key = f'{key}_lock'
+    entry = await _aget_entry(key, local)
+
+    if isinstance(entry, CachedEntry) and (stale or _is_fresh(entry)):
+        if not _should_refresh(entry):
+            return entry
+        inflight = _ainflight.get(asyncio.get_running_loop(), {})
+        token = None if key in inflight else await _aacquire(lock_key)
+        if token is None:
+            return entry
+        try:
+            return await _asingle_flight(key, lambda: _arefresh(key, producer, timeout, lock_key, token, local))
+        except Exception:
+            logger.exception('Refreshing %s failed, serving the previous value', key)
+            return entry
+
+    return await _asingle_flight(key, lambda: _afill(key, producer, timeout, lock_key, local))
+
+
+async def acached_call(key, producer, timeout, local=False, stale=True):
+    return (await acached_entry(key, producer, timeout, local, stale)).value
@@ -0,0 +1,98 @@
+import uuid
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Orders, Products
+from .pricing import current_index, current_price
+from .tasks import dispatch_order_side_effects
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_pk):
+        super().__init__(f'Not enough stock for product {product_pk}')
+        self.product_pk = product_pk
+
+
+def new_order_id():
+    return f"ORD-{uuid.uuid4().hex[:10].upper()}"
+
+
+def reserve_stock(product_pk, quantity):
+    """
+    Takes `quantity` units with one conditional UPDATE and counts them as sold.
+    Returns False (and writes nothing) when there is not enough stock.
+    """
+    return Products.objects.filter(pk=product_pk, stock__gte=quantity).update(
+        stock=F('stock') - quantity,
+        total_sold=F('total_sold') + quantity,
+    ) == 1
+
+
+def place_single_order(customer, product, quantity):
+    # stock is reserved before the insert: the insert's foreign key check
+    # would otherwise take a shared lock on the product row first, and two
+    # checkouts upgrading that lock at the same time deadlock. Everything else
+    # (notification, loyalty points, rollups, caches) runs in a Celery task.
+    with transaction.atomic():
+        if not reserve_stock(product.pk, quantity):
+            raise OutOfStock(product.pk)
+        now = timezone.now()
+        order = Orders.objects.create(
+            order_id=new_order_id(),
+            customer=customer,
+            product=product,
+            quantity=quantity,
+            unit_price=current_price(product, now),
+            order_date=now
+        )
+        dispatch_order_side_effects([order])
+    return order
+
+
+def place_order_lines(customer, lines, all_or_nothing=False):
+    """
+    Places one order per (product, quantity) line in a single transaction.
+
+    Stock is reserved in product id order, a fixed lock order so concurrent
+    multi-line checkouts cannot deadlock, and the orders go in with one
+    bulk_create. Returns (orders, outcomes) with one outcome dict per line in
+    input order. With all_or_nothing a single failed line rolls back the batch.
+    """
+    outcomes = [None] * len(lines)
+    placed = []
+    now = timezone.now()
+    prices = current_index()
+
+    try:
+        with transaction.atomic():
+            for index in sorted(range(len(lines)), key=lambda i: lines[i][0].pk):
+                product, quantity = lines[index]
+                if reserve_stock(product.pk, quantity):
+                    order = Orders(
+                        order_id=new_order_id(),
+                        customer=customer,
+                        product=product,
+                        quantity=quantity,
+                        unit_price=current_price(product, now, prices),
+                        order_date=now
+                    )
+                    placed.append(order)
+                    outcomes[index] = {'status': 'placed', 'order_id': order.order_id, 'unit_price': order.unit_price}
+                else:
+                    outcomes[index] = {'status': 'out_of_stock'}
+
+            if all_or_nothing and len(placed) != len(lines):
+                raise OutOfStock(None)
+
+            Orders.objects.bulk_create(placed)
+            dispatch_order_side_effects(placed)
+    except OutOfStock:
+        for outcome in outcomes:
+            if outcome['status'] == 'placed':
+                outcome['status'] = 'rolled_back'
+                del outcome['order_id'], outcome['unit_price']
+        return [], outcomes
+
+    return placed, outcomes
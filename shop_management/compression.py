@@ -0,0 +1,164 @@
+import gzip
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .caching import ashared_get, local_get, local_set, shared_get
+
+try:
+    import brotli # type: ignore
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard # type: ignore
+except ImportError:
+    zstandard = None
+
+# Cached listings keep their final response body next to the page data: the
+# serialized envelope, compressed for the encoding the client negotiated,
+# under the listing's versioned key plus that encoding. A hit is returned as
+# is, no query, serialization or compression. Bodies are compressed once per
+# fill, so the levels favour size over speed. Everything else is left to
+# GZipMiddleware, which skips responses that already have a Content-Encoding.
+# time_taken inside a cached body is the time the body took to build.
+# Listings marked local also keep their bodies in the per-process L1.
+# A body never outlives the freshness of the page it was built from, and a
+# page served stale (being refreshed, or its refresh failed) is not kept.
+MIN_SIZE = 200
+
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS['br'] = lambda body: brotli.compress(body, quality=9)
+if zstandard is not None:
+    ENCODERS['zstd'] = lambda body: zstandard.ZstdCompressor(level=10).compress(body)
+ENCODERS['gzip'] = lambda body: gzip.compress(body, compresslevel=9, mtime=0)
+
+# server preference, first one the client accepts wins
+PREFERENCE = [name for name in getattr(settings, 'RESPONSE_ENCODINGS', ('br', 'zstd', 'gzip')) if name in ENCODERS]
+
+
+def negotiate(request):
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for name in PREFERENCE:
+        if accepted.get(name, accepted.get('*', 0)) > 0:
+            return name
+    return 'identity'
+
+
+def encode(body, encoding):
+    if encoding == 'identity' or len(body) < MIN_SIZE:
+        return body, 'identity'
+    compressed = ENCODERS[encoding](body)
+    if len(compressed) >= len(body):
+        return body, 'identity'
+    return compressed, encoding
+
+
+def body_response(content, encoding, etag=None):
+    response = HttpResponse(content, content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    if etag:
+        # one validator for every encoding of the same page, so it is weak
+        # on encoded bodies, like GZipMiddleware does
+        response['ETag'] = etag if encoding == 'identity' else f'W/{etag}'
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _lookup(request, key, timeout, local):
+    encoding = negotiate(request)
+    body_key = f'{key}_body_{encoding}'
+    # on a miss timed_response encodes the fresh body and store_body keeps it
+    request.body_cache = (body_key, encoding, timeout, local)
+    return body_key
+
+
+def _hit_response(request, hit):
+    if hit is None:
+        return None
+    request.body_cache = None
+    return body_response(*hit, etag=getattr(request, 'etag', None))
+
+
+def cached_body(request, key, timeout, local=False):
+    """The cached response for a listing's versioned key, or None on a miss."""
+    if request is None or request.method != 'GET':
+        return None
+    body_key = _lookup(request, key, timeout, local)
+    hit = local_get(body_key) if local else None
+    if hit is None:
+        hit = shared_get(body_key)
+        if local and hit is not None:
+            local_set(body_key, hit, timeout)
+    return _hit_response(request, hit)
+
+
+async def acached_body(request, key, timeout, local=False):
+    if request is None or request.method != 'GET':
+        return None
+    body_key = _lookup(request, key, timeout, local)
+    hit = local_get(body_key) if local else None
+    if hit is None:
+        hit = await ashared_get(body_key)
+        if local and hit is not None:
+            local_set(body_key, hit, timeout)
+    return _hit_response(request, hit)
+
+
+def limit_body(request, expires_at):
+    """Caps the pending body fill at the page's expires_at, drops it for a stale page."""
+    pending = getattr(request, 'body_cache', None)
+    if not pending:
+        return
+    ttl = int(expires_at - time())
+    if ttl < 1:
+        request.body_cache = None
+    elif ttl < pending[2]:
+        request.body_cache = (pending[0], pending[1], ttl, pending[3])
+
+
+def encoded_response(request, body):
+    """Response for a freshly serialized body, encoded for the pending cache fill if any."""
+    pending = getattr(request, 'body_cache', None)
+    content, encoding = encode(body, pending[1] if pending else 'identity')
+    return body_response(content, encoding, getattr(request, 'etag', None))
+
+
+def _entry(request, response):
+    pending = getattr(request, 'body_cache', None)
+    if not pending or response.status_code != 200 or response.streaming:
+        return None
+    body_key, _, timeout, local = pending
+    value = (response.content, response.get('Content-Encoding', 'identity'))
+    if local:
+        local_set(body_key, value, timeout)
+    return body_key, value, timeout
+
+
+def store_body(request, response):
+    entry = _entry(request, response)
+    if entry:
+        cache.set(*entry)
+
+
+async def astore_body(request, response):
+    entry = _entry(request, response)
+    if entry:
+        await cache.aset(*entry)
@@ -1,6 +1,3 @@
-import httpx # type: ignore
-import asyncio
-
 import json
 import uuid
 
@@ -10,12 +7,17 @@ from time import time
 from datetime import timedelta
 from django.utils import timezone
 from .models import CustomSession
+from .session_cache import invalidate_session
 from functools import wraps
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from functools import wraps
+from asgiref.sync import iscoroutinefunction
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import check_password
 from .models import Customers, Shopkeepers
+from .serialization import dumps, json_response
+from .compression import astore_body, encoded_response, store_body
+from .batch import BatchError, iter_batch, ndjson_lines, parse_requests, run_batch
 
 
 def authenticate_user(username: str, password: str):
@@ -40,26 +42,41 @@ def authenticate_user(username: str, password: str):
     return None, None
 
 
+def _timed(func, data, start, request):
+    end = time()
+    duration = round(end - start, 3)
+
+    if isinstance(data, HttpResponse):
+        return data
+
+    if isinstance(data, dict) and 'error' in data:
+        return json_response(data, status=data.get('status_code', 400))
+
+    # compressed for the client and cached when run_listing missed the body cache
+    return encoded_response(request, dumps({
+        "api_name": func.__name__,
+        "data": data,
+        "status": "success",
+        "time_taken": f"{duration}s"
+    }))
+
+
 def timed_response(func):
+    if iscoroutinefunction(func):
+        @wraps(func)
+        async def async_wrapper(request, *args, **kwargs):
+            start = time()
+            response = _timed(func, await func(request, *args, **kwargs), start, request)
+            await astore_body(request, response)
+            return response
+        return async_wrapper
+
     @wraps(func)
     def wrapper(request, *args, **kwargs):
         start = time()
-        data = func(request, *args, **kwargs)
-        end = time()
-        duration = round(end - start, 3)
-
-        if isinstance(data, HttpResponse):
-            return data
-
-        if isinstance(data, dict) and 'error' in data:
-            return JsonResponse(data, status=data.get('status_code', 400))
-
-        return JsonResponse({
-            "api_name": func.__name__,
-            "data": data,
-            "status": "success",
-            "time_taken": f"{duration}s"
-        })
+        response = _timed(func, func(request, *args, **kwargs), start, request)
+        store_body(request, response)
+        return response
     return wrapper
 
 
@@ -72,6 +89,8 @@ def create_session(user_obj, role, duration_hours=4):
         user = user_obj if role== 'superuser' else None,
         expires_at=expires_at
     )
+    # drop any cached "unknown session" entry for this id
+    invalidate_session(session.session_id, revoked=False)
     return session
 
 def _authorize_shopkeeper(request):
@@ -92,6 +111,14 @@ def _authorize_superuser(request):
         return user
     return None
 
+async def _aauthorize_superuser(request):
+    # request.user is a lazy object that hits the database, async views use auser()
+    auser = getattr(request, 'auser', None)
+    user = await auser() if auser else None
+    if user and user.is_active and user.is_superuser:
+        return user
+    return None
+
 
 def pagination_helper(items, page=1, page_size=10):
     total_items = len(items)
@@ -108,36 +135,6 @@ def pagination_helper(items, page=1, page_size=10):
     return items[start:end], total_pages
 
 
-# Helper coroutine to fetch a single URL
-async def fetch(client, req, cookies=None):
-    method = req.get("method").upper()
-    url = req["url"]
-    body = req.get("body", None)
-    params = req.get("params", None)
-    
-    if method == "GET":
-        res = await client.get(url,params=params, cookies=cookies)
-    elif method == "POST":
-        if not body and params:
-            return "POST requests require a body"
-        res = await client.post(url, json=body, cookies=cookies)
-    elif method == "PUT":
-        if not body and params:
-            return "PUT requests require a body"
-        res = await client.put(url, json=body, cookies=cookies)
-    elif method == "DELETE":
-        if not body and params:
-            return "DELETE requests require a body"
-        res = await client.delete(url, json=body, cookies=cookies)
-    else:
-        return f"Method {method} not supported"
-
-    try:
-        return res.json()
-    except:
-        return res.text
-
-
 @csrf_exempt
 
 async def fetch_multiple_requests(request):
@@ -146,13 +143,12 @@ async def fetch_multiple_requests(request):
     
     try:
         body = json.loads(request.body)
-        requests_list = body.get("requests", [])
+        requests_list = parse_requests(body.get("requests", []))
+    except BatchError as e:
+        return JsonResponse({"error": str(e)}, status=400)
     except:
         return JsonResponse({"error": "Invalid JSON"}, status=400)
-    
-    if not requests_list:
-        return JsonResponse({"error": "No requests provided"}, status=400)
-    
+
     cookies = {}
     
     shop_session = request.COOKIES.get("SHOPKEEPER_SESSIONID")
@@ -163,17 +159,28 @@ async def fetch_multiple_requests(request):
     elif cust_session:
         cookies["CUSTOMER_SESSIONID"] = cust_session
 
-    
-    async with httpx.AsyncClient() as client:
-        
-        for req in requests_list:
-            if "method" not in req or "url" not in req:
-                return JsonResponse({"error": "Each request must have 'method' and 'url'"}, status=400)
-        
-        tasks = [fetch(client, req, cookies) for req in requests_list ]
-        results = await asyncio.gather(*tasks)
-    
-    return JsonResponse({req["url"]: res for req, res in zip(requests_list, results)})
+    # sub-requests for this server run in-process unless "dispatch": "http"
+    # asks for the old loopback behaviour; other hosts always go over HTTP.
+    # Results are a list in request order, so repeated URLs keep their own entry
+    in_process = body.get("dispatch", "local") != "http"
+
+    # "stream": true sends each entry as an NDJSON line as soon as it finishes
+    # (completion order, match them up by index). Under WSGI Django has to
+    # drain the async generator first, so entries only arrive early on ASGI
+    if body.get("stream"):
+        response = StreamingHttpResponse(
+            ndjson_lines(iter_batch(request, requests_list, in_process, cookies)),
+            content_type='application/x-ndjson',
+        )
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    results = await run_batch(request, requests_list, in_process, cookies)
+    return JsonResponse({'results': results})
+
+
+# a batch inside a batch would recurse through dispatch
+fetch_multiple_requests.batch_exempt = True
 
 
 
@@ -0,0 +1,411 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from hashlib import md5
+
+from django.conf import settings
+from django.db.models import Count
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+
+from .compression import acached_body, cached_body, limit_body
+from .caching import acached_entry, aversioned_key, cached_entry, versioned_key, CATALOGUE, customer_orders, shopkeeper_products
+from .models import Categories, Orders, Products
+from .pagination import apaginate_queryset, akeyset_paginate, paginate_queryset, keyset_paginate, InvalidCursor
+from .pricing import acurrent_index, apply_effective_prices, current_index, price_cache_timeout
+from .search import matching_products, rank_products
+
+# Request parsing and query building for the read-only listings, shared by
+# the sync views (views.py) and their async twins (async_views.py). A parse
+# function returns a Listing, or a JsonResponse when the request is invalid;
+# run_listing / arun_listing fetch the page (cached when cache_key is set)
+# and hand it to listing.render, or to listing.render_cursor in cursor mode.
+# Given the request, cached listings also answer conditional GETs: the ETag
+# is derived from the versioned cache key, so If-None-Match is checked
+# before any query runs. After that the finished, compressed response body
+# is looked up under the same key (compression.py).
+
+Listing = namedtuple('Listing', [
+    'qs', 'fields', 'page', 'render',
+    'cache_key', 'namespaces', 'timeout', 'priced',
+    'cursor', 'sort_mapping', 'sort_by', 'render_cursor', 'local',
+], defaults=(None, (), None, False, None, None, None, None, False))
+
+# recent_orders pages are cached per slot of this many seconds
+RECENT_ORDERS_SLOT = 300
+
+# helper keys effective prices are computed from
+PRICE_KEYS = {'id', 'discount_price'}
+
+ORDER_SORTS = {
+    'order_date': '-order_date',
+    'quantity': '-quantity',
+    'price_asc': 'product__price',
+    'price_desc': '-product__price',
+}
+
+PRODUCT_SORTS = {
+    'price_asc': 'price',
+    'price_desc': '-price',
+    'rating': '-rating',
+    'stock': '-stock',
+    'created_at': '-created_at',
+}
+
+
+def page_param(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
+def priced_page(qs, fields, page, index=None):
+    # effective prices are computed inside the cached producer, callers cap
+    # the cache timeout with price_cache_timeout() so pages expire when a
+    # promotion starts or ends
+    extra = PRICE_KEYS.difference(fields)
+    items, total_pages, total_count = paginate_queryset(qs.values(*fields, *extra), page)
+    if items:
+        apply_effective_prices(items, drop=extra, index=index)
+    return items, total_pages, total_count
+
+
+async def apriced_page(qs, fields, page, index):
+    extra = PRICE_KEYS.difference(fields)
+    items, total_pages, total_count = await apaginate_queryset(qs.values(*fields, *extra), page)
+    if items:
+        apply_effective_prices(items, drop=extra, index=index)
+    return items, total_pages, total_count
+
+
+def search_listing(request):
+    name = request.GET.get('name', '').strip()
+    page = page_param(request)
+    if not name:
+        return JsonResponse({'error': 'Product name required'}, status=400)
+
+    def render(products, total_pages, total_count):
+        if not total_count:
+            return JsonResponse({'error': 'No products found for your search'}, status=404)
+        if products is None:
+            return JsonResponse({'error': f'Invalid page number, total pages are {total_pages}'}, status=400)
+        return {
+            'related_products': list(products),
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_products': total_count
+        }
+
+    return Listing(
+        qs=rank_products(Products.objects.filter(id__in=matching_products(name)), name),
+        fields=('name', 'price', 'stock'),
+        page=page,
+        render=render,
+        cache_key=f'product_search_{name.lower()}_page_{page}',
+        namespaces=(CATALOGUE,),
+        timeout=settings.CACHE_TTL,
+        priced=True,
+        # shared by every user and read constantly, kept in the per-process L1
+        local=True,
+    )
+
+
+def product_listing(request, user):
+    category_name = request.GET.get('category', None)
+    search_name = request.GET.get('search', '').strip()
+    sort_by = request.GET.get('sort', 'created_at')
+    page = page_param(request)
+    cursor = request.GET.get('cursor')
+    min_rating = request.GET.get('min_rating', None)
+
+    qs = Products.objects.filter(created_by=user)
+
+    if category_name:
+        qs = qs.filter(category__name__iexact=category_name)
+
+    if search_name:
+        qs = qs.filter(id__in=matching_products(search_name))
+
+    # rating is the denormalized review average, an indexed column
+    if min_rating:
+        try:
+            min_rating = Decimal(min_rating)
+        except InvalidOperation:
+            min_rating = None
+        if min_rating is None or not min_rating.is_finite():
+            return JsonResponse({'error': 'min_rating must be a number'}, status=400)
+        qs = qs.filter(rating__gte=min_rating)
+        # 1, 1.0 and 1e0 share one cache entry
+        min_rating = min_rating.normalize()
+
+    qs = qs.order_by(PRODUCT_SORTS.get(sort_by, '-created_at'), '-id')
+    if cursor is not None and sort_by not in PRODUCT_SORTS:
+        sort_by = 'created_at'
+
+    def render(products, total_pages, total_count):
+        if products is None or page > total_pages:
+            return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
+        return {
+            'your_products': list(products),
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_products': total_count
+        }
+
+    def render_cursor(products, next_cursor, sort_by):
+        return {
+            'your_products': products,
+            'next_cursor': next_cursor,
+            'sort': sort_by
+        }
+
+    return Listing(
+        qs=qs,
+        fields=('product_id', 'name', 'price', 'stock', 'rating', 'rating_count', 'category__name'),
+        page=page,
+        render=render,
+        cache_key=f'products_user_{user.id}_cat_{category_name}_search_{search_name}_rating_{min_rating}_sort_{sort_by}_page_{page}',
+        namespaces=(shopkeeper_products(user.id),),
+        timeout=settings.CACHE_TTL,
+        priced=True,
+        # cursor mode (infinite scroll), pages are index seeks so they are not cached
+        cursor=cursor,
+        sort_mapping=PRODUCT_SORTS,
+        sort_by=sort_by,
+        render_cursor=render_cursor,
+    )
+
+
+def category_listing(request):
+    page = page_param(request)
+
+    def render(requested_categories, total_pages, total_count):
+        if requested_categories is None:
+            return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
+        return {
+            'categories': requested_categories,
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_categories': total_count
+        }
+
+    return Listing(
+        qs=Categories.objects.annotate(product_count=Count('products')).order_by('-product_count', 'name'),
+        fields=('name', 'description', 'product_count'),
+        page=page,
+        render=render,
+        cache_key=f'categories_page_{page}',
+        namespaces=(CATALOGUE,),
+        timeout=settings.CACHE_TTL,
+        local=True,
+    )
+
+
+def _orders_render(result_key, page):
+    def render(orders, total_pages, total_count):
+        if not orders:
+            return JsonResponse({'error': f'No orders found or invalid page number, total pages are {total_pages}'}, status=404)
+        return {
+            result_key: list(orders),
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_orders': total_count
+        }
+    return render
+
+
+def my_orders_listing(request, user):
+    page = page_param(request)
+    date_from = request.GET.get('date_from', None)
+    date_to = request.GET.get('date_to', None)
+    sort_by = request.GET.get('sort', 'order_date')
+    cursor = request.GET.get('cursor')
+
+    qs = Orders.objects.filter(customer=user).select_related('product')
+
+    if date_from:
+        try:
+            qs = qs.filter(order_date__gte=date_from)
+        except:
+            pass
+    if date_to:
+        try:
+            qs = qs.filter(order_date__lte=date_to)
+        except:
+            pass
+
+    qs = qs.order_by(ORDER_SORTS.get(sort_by, '-order_date'), '-id')
+    if cursor is not None and sort_by not in ORDER_SORTS:
+        sort_by = 'order_date'
+
+    def render_cursor(orders, next_cursor, sort_by):
+        return {
+            'my_orders': orders,
+            'next_cursor': next_cursor,
+            'sort': sort_by
+        }
+
+    return Listing(
+        qs=qs,
+        fields=('order_id', 'product__name', 'quantity', 'product__price', 'order_date', 'product__category__name'),
+        page=page,
+        render=_orders_render('my_orders', page),
+        cache_key=f'my_orders_user_{user.id}_date_from_{date_from}_date_to_{date_to}_sort_{sort_by}_page_{page}',
+        namespaces=(customer_orders(user.id),),
+        timeout=settings.CACHE_TTL,
+        cursor=cursor,
+        sort_mapping=ORDER_SORTS,
+        sort_by=sort_by,
+        render_cursor=render_cursor,
+    )
+
+
+def recent_orders_listing(request, user):
+    page = page_param(request)
+    sort_by = request.GET.get('sort', 'order_date')
+
+    # the two week window moves in RECENT_ORDERS_SLOT steps, and the slot is
+    # part of the cache key (and so of the ETag): a page cached or validated
+    # in one slot is never served for the next one
+    slot = int(timezone.now().timestamp()) // RECENT_ORDERS_SLOT
+    two_weeks_ago = datetime.fromtimestamp(slot * RECENT_ORDERS_SLOT, dt_timezone.utc) - timedelta(days=14)
+    qs = Orders.objects.filter(customer=user, order_date__gte=two_weeks_ago).select_related('product')
+    qs = qs.order_by(ORDER_SORTS.get(sort_by, '-order_date'), '-id')
+
+    return Listing(
+        qs=qs,
+        fields=('id', 'product__name', 'product__category__name', 'quantity', 'order_date', 'product__price'),
+        page=page,
+        render=_orders_render('recent_orders', page),
+        cache_key=f'recent_orders_user_{user.id}_since_{slot}_sort_{sort_by}_page_{page}',
+        namespaces=(customer_orders(user.id),),
+        timeout=RECENT_ORDERS_SLOT,
+    )
+
+
+def orders_today_listing(request, user):
+    page = page_param(request)
+    sort_by = request.GET.get('sort', 'order_date')
+
+    today = timezone.now().date()
+    qs = Orders.objects.filter(customer=user, order_date__date=today).select_related('product')
+    qs = qs.order_by(ORDER_SORTS.get(sort_by, '-order_date'), '-id')
+
+    return Listing(
+        qs=qs,
+        fields=('id', 'product__name', 'product__category__name', 'quantity', 'order_date', 'product__price'),
+        page=page,
+        render=_orders_render('today_orders', page),
+        cache_key=f'orders_today_{today}_user_{user.id}_sort_{sort_by}_page_{page}',
+        namespaces=(customer_orders(user.id),),
+        timeout=settings.CACHE_TTL,
+    )
+
+
+def listing_etag(key, index=None):
+    # the versioned key changes whenever the page's data does, priced pages
+    # also change when a promotion starts or ends (the next price change)
+    if index is not None:
+        key = f'{key}_prices_{index.next_change(timezone.now().timestamp())}'
+    return f'"{md5(key.encode()).hexdigest()}"'
+
+
+def _not_modified(request, etag):
+    # 304 when the client's copy is current, full responses get the ETag
+    # from request.etag
+    if request is None or request.method != 'GET':
+        return None
+    request.etag = etag
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+    return response
+
+
+def _cursor_fields(listing):
+    if listing.priced:
+        return (*listing.fields, *PRICE_KEYS.difference(listing.fields))
+    return listing.fields
+
+
+def run_listing(listing, request=None):
+    if isinstance(listing, HttpResponse):
+        return listing
+
+    if listing.cursor is not None:
+        try:
+            rows, next_cursor, sort_by = keyset_paginate(
+                listing.qs, _cursor_fields(listing), listing.sort_mapping, listing.sort_by, listing.cursor
+            )
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        if listing.priced:
+            apply_effective_prices(rows, drop=PRICE_KEYS.difference(listing.fields))
+        return listing.render_cursor(rows, next_cursor, sort_by)
+
+    timeout = listing.timeout
+    index = None
+    if listing.priced:
+        index = current_index()
+        timeout = price_cache_timeout(timeout, index=index)
+        producer = lambda: priced_page(listing.qs, listing.fields, listing.page, index)
+    else:
+        producer = lambda: paginate_queryset(listing.qs.values(*listing.fields), listing.page)
+
+    if listing.cache_key:
+        key = versioned_key(listing.cache_key, *listing.namespaces)
+        not_modified = _not_modified(request, listing_etag(key, index))
+        if not_modified is not None:
+            return not_modified
+        cached = cached_body(request, key, timeout, listing.local)
+        if cached is not None:
+            return cached
+        # priced pages expire exactly at the next price change, never served stale
+        entry = cached_entry(key, producer, timeout, listing.local, stale=not listing.priced)
+        limit_body(request, entry.expires_at)
+        result = entry.value
+    else:
+        result = producer()
+    return listing.render(*result)
+
+
+async def arun_listing(listing, request=None):
+    if isinstance(listing, HttpResponse):
+        return listing
+
+    if listing.cursor is not None:
+        try:
+            rows, next_cursor, sort_by = await akeyset_paginate(
+                listing.qs, _cursor_fields(listing), listing.sort_mapping, listing.sort_by, listing.cursor
+            )
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        if listing.priced:
+            apply_effective_prices(rows, drop=PRICE_KEYS.difference(listing.fields), index=await acurrent_index())
+        return listing.render_cursor(rows, next_cursor, sort_by)
+
+    timeout = listing.timeout
+    index = None
+    if listing.priced:
+        index = await acurrent_index()
+        timeout = price_cache_timeout(timeout, index=index)
+        producer = lambda: apriced_page(listing.qs, listing.fields, listing.page, index)
+    else:
+        producer = lambda: apaginate_queryset(listing.qs.values(*listing.fields), listing.page)
+
+    if listing.cache_key:
+        key = await aversioned_key(listing.cache_key, *listing.namespaces)
+        not_modified = _not_modified(request, listing_etag(key, index))
+        if not_modified is not None:
+            return not_modified
+        cached = await acached_body(request, key, timeout, listing.local)
+        if cached is not None:
+            return cached
+        entry = await acached_entry(key, producer, timeout, listing.local, stale=not listing.priced)
+        limit_body(request, entry.expires_at)
+        result = entry.value
+    else:
+        result = await producer()
+    return listing.render(*result)
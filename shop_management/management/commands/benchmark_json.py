@@ -0,0 +1,77 @@
+import json
+from datetime import timedelta
+from decimal import Decimal
+from timeit import Timer
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop_management.serialization import BACKENDS
+
+
+def product_rows(count):
+    # the shape of a list_products page (priced listing)
+    return [{
+        'product_id': f'PRO-{i:06d}',
+        'name': f'Product {i}',
+        'price': Decimal('1299.00') + i,
+        'stock': i % 50,
+        'rating': Decimal('4.35'),
+        'rating_count': i % 300,
+        'category__name': 'Phones',
+        'effective_price': Decimal('1169.10') + i,
+        'promotion_discount': 10 if i % 3 else None,
+    } for i in range(count)]
+
+
+def order_rows(count):
+    # the shape of a my_orders page
+    now = timezone.now()
+    return [{
+        'order_id': f'ORD-{i:010d}',
+        'product__name': f'Product {i}',
+        'quantity': i % 5 + 1,
+        'product__price': Decimal('1299.00') + i,
+        'order_date': now - timedelta(minutes=i, microseconds=i),
+        'product__category__name': 'Phones',
+    } for i in range(count)]
+
+
+PAYLOADS = {
+    'list_products': (product_rows, 'your_products'),
+    'my_orders': (order_rows, 'my_orders'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compares the JSON serializer backends on list_products and my_orders shaped payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        backends = sorted(BACKENDS)
+        self.stdout.write(f"{'payload':<15}{'rows':>6}" + ''.join(f'{name:>12}' for name in backends) + '   (us per response)')
+
+        for payload, (build, key) in PAYLOADS.items():
+            for size in options['sizes']:
+                # the envelope timed_response builds around a page
+                data = {
+                    'api_name': payload,
+                    'data': {key: build(size), 'current_page': 1, 'total_pages': 1, 'total_orders': size},
+                    'status': 'success',
+                    'time_taken': '0.001s',
+                }
+                # same values from every backend, only the whitespace differs
+                decoded = [json.loads(BACKENDS[name](data)) for name in backends]
+                if any(value != decoded[0] for value in decoded):
+                    self.stderr.write(f'{payload}/{size}: backends disagree')
+
+                timings = []
+                for name in backends:
+                    timer = Timer(lambda: BACKENDS[name](data))
+                    number, _ = timer.autorange()
+                    best = min(timer.repeat(options['repeat'], number)) / number
+                    timings.append(f'{best * 1e6:>12.1f}')
+                self.stdout.write(f'{payload:<15}{size:>6}' + ''.join(timings))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from shop_management.models import Products
+from shop_management.search import index_products
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product search token index in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                Products.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            index_products(ids)
+            last_id = ids[-1]
+            total += len(ids)
+            self.stdout.write(f'Indexed {total} products')
+
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt for {total} products'))
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from shop_management.caching import bump, CATALOGUE, shopkeeper_products
+from shop_management.models import Products, Reviews, Shopkeepers
+from shop_management.ratings import average
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds product and shopkeeper rating aggregates from Reviews in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        total = self.in_batches(Products, batch_size, self.recompute_products)
+        self.stdout.write(f'Recomputed ratings for {total} products')
+        total = self.in_batches(Shopkeepers, batch_size, self.recompute_shopkeepers)
+        self.stdout.write(f'Recomputed ratings for {total} shopkeepers')
+
+        # every listing may show a changed rating, start all view caches over
+        bump(CATALOGUE, *[shopkeeper_products(pk) for pk in Shopkeepers.objects.values_list('id', flat=True)])
+        self.stdout.write(self.style.SUCCESS('Ratings recomputed'))
+
+    def in_batches(self, model, batch_size, recompute):
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(model.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return total
+            recompute(ids)
+            last_id = ids[-1]
+            total += len(ids)
+
+    @transaction.atomic
+    def recompute_products(self, ids):
+        # rows are locked so reviews written meanwhile wait for the batch
+        list(Products.objects.select_for_update().filter(id__in=ids).values_list('id', flat=True))
+        totals = {
+            row['product_id']: (row['rating_sum'], row['rating_count'])
+            for row in Reviews.objects.filter(product_id__in=ids).values('product_id').annotate(
+                rating_sum=Sum('rating'), rating_count=Count('id')
+            ).order_by()
+        }
+        products = []
+        for product_id in ids:
+            rating_sum, rating_count = totals.get(product_id, (0, 0))
+            products.append(Products(
+                id=product_id, rating_sum=rating_sum, rating_count=rating_count,
+                rating=average(rating_sum, rating_count)
+            ))
+        Products.objects.bulk_update(products, ['rating_sum', 'rating_count', 'rating'], batch_size=1000)
+
+    @transaction.atomic
+    def recompute_shopkeepers(self, ids):
+        list(Shopkeepers.objects.select_for_update().filter(id__in=ids).values_list('id', flat=True))
+        totals = {
+            row['created_by_id']: (row['rating_sum'] or 0, row['rating_count'] or 0)
+            for row in Products.objects.filter(created_by_id__in=ids).values('created_by_id').annotate(
+                rating_sum=Sum('rating_sum'), rating_count=Sum('rating_count')
+            ).order_by()
+        }
+        shopkeepers = []
+        for shopkeeper_id in ids:
+            rating_sum, rating_count = totals.get(shopkeeper_id, (0, 0))
+            shopkeepers.append(Shopkeepers(
+                id=shopkeeper_id, rating_sum=rating_sum, rating_count=rating_count,
+                rating=float(average(rating_sum, rating_count))
+            ))
+        Shopkeepers.objects.bulk_update(shopkeepers, ['rating_sum', 'rating_count', 'rating'], batch_size=1000)
@@ -0,0 +1,104 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce, TruncDay, TruncHour, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from shop_management.models import Orders, Products, SalesRollups
+
+ROLLUP_TRUNCATIONS = (('hour', TruncHour), ('day', TruncDay), ('week', TruncWeek))
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes Products.total_sold and backfills the hour/day/week sales rollups '
+        'from processed Orders in batches'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--skip-rollups', action='store_true', help='Only recompute Products.total_sold')
+        parser.add_argument('--since', help='Only rebuild rollups from this date (YYYY-MM-DD), rounded down to its week')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since_date = parse_date(options['since'])
+            if not since_date:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+            since_date -= timedelta(days=since_date.weekday())
+            since = timezone.make_aware(datetime.combine(since_date, time.min))
+
+        batch_size = options['batch_size']
+        last_id = 0
+        total = 0
+        while True:
+            ids = list(
+                Products.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            self.reconcile_batch(ids, not options['skip_rollups'], since)
+            last_id = ids[-1]
+            total += len(ids)
+            self.stdout.write(f'Reconciled {total} products')
+
+        self.stdout.write(self.style.SUCCESS(f'Sales counters reconciled for {total} products'))
+
+    @transaction.atomic
+    def reconcile_batch(self, ids, rollups, since):
+        # locking the products first holds back checkouts for this batch, so
+        # no order can land between the aggregate and the write
+        list(Products.objects.select_for_update().filter(id__in=ids).values_list('id', flat=True))
+
+        orders = Orders.objects.filter(product_id__in=ids)
+        # orders still waiting for process_order_side_effects are added to the
+        # rollups by that task, so the rebuild skips them. Locking them makes a
+        # task that already claimed some commit first, and one that has not
+        # yet skip them (skip_locked) until the pending-order sweep
+        list(orders.select_for_update().filter(processed_at__isnull=True).values_list('id', flat=True))
+        totals = dict(orders.values('product_id').annotate(sold=Sum('quantity')).values_list('product_id', 'sold'))
+        Products.objects.bulk_update(
+            [Products(id=product_id, total_sold=totals.get(product_id) or 0) for product_id in ids],
+            ['total_sold'],
+            batch_size=1000,
+        )
+
+        if not rollups:
+            return
+
+        stale = SalesRollups.objects.filter(product_id__in=ids)
+        orders = orders.filter(order_date__isnull=False, processed_at__isnull=False)
+        if since:
+            stale = stale.filter(bucket__gte=since)
+            orders = orders.filter(order_date__gte=since)
+        stale.delete()
+
+        # orders placed before unit_price was recorded fall back to the static price
+        revenue = Sum(
+            F('quantity') * Coalesce('unit_price', 'product__discount_price', 'product__price'),
+            output_field=DecimalField(max_digits=14, decimal_places=2),
+        )
+        rows = []
+        for period, trunc in ROLLUP_TRUNCATIONS:
+            buckets = (
+                orders.annotate(bucket=trunc('order_date'))
+                .values('product_id', 'product__created_by_id', 'bucket')
+                .annotate(units=Sum('quantity'), revenue=revenue)
+                .order_by()
+            )
+            rows += [
+                SalesRollups(
+                    product_id=row['product_id'],
+                    shopkeeper_id=row['product__created_by_id'],
+                    period=period,
+                    bucket=row['bucket'],
+                    units=row['units'],
+                    revenue=row['revenue'],
+                )
+                for row in buckets
+            ]
+        SalesRollups.objects.bulk_create(rows, batch_size=1000)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0004_products_product_id_alter_customsession_session_id'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='categories',
+            name='description',
+            field=models.TextField(blank=True, default='No description about this category'),
+        ),
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='7f157348-19f0-4371-b964-40a397c5a4ac', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['customer', 'order_date'], name='orders_custome_9fba8b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['created_by', 'created_at'], name='products_created_8b7fd9_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='52de1134-a68a-492b-8216-0101ff593ac3', max_length=64, unique=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='cartitems',
+            unique_together={('cart', 'product')},
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0006_cartitems_unique_product'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='b0163ec0-a8b6-4ca2-bab2-88853ab8d864', max_length=64, unique=True),
+        ),
+        migrations.CreateModel(
+            name='ProductSearchTokens',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50)),
+                ('weight', models.IntegerField(default=1)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='shop_management.products')),
+            ],
+            options={
+                'db_table': 'product_search_tokens',
+                'unique_together': {('token', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0007_product_search_tokens'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollups',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('units', models.IntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'sales_rollups',
+            },
+        ),
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='fd49e8f0-847c-4f3c-9cee-b6aa7a80e3fe', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['created_by', 'total_sold'], name='products_created_7b3996_idx'),
+        ),
+        migrations.AddField(
+            model_name='salesrollups',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='shop_management.products'),
+        ),
+        migrations.AddIndex(
+            model_name='salesrollups',
+            index=models.Index(fields=['period', 'bucket', 'units'], name='sales_rollu_period_484e2c_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='salesrollups',
+            unique_together={('product', 'period', 'bucket')},
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0008_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salesrollups',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='salesrollups',
+            name='shopkeeper',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='shop_management.shopkeepers'),
+        ),
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='cfc5192b-9691-4f06-8195-97f67136543c', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='salesrollups',
+            index=models.Index(fields=['shopkeeper', 'period', 'bucket'], name='sales_rollu_shopkee_2245d0_idx'),
+        ),
+    ]
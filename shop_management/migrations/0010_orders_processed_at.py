@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:42
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_orders_processed(apps, schema_editor):
+    # orders placed before this migration already had their side effects
+    # applied synchronously, the pending-order sweep must not replay them
+    Orders = apps.get_model('shop_management', 'Orders')
+    Orders.objects.filter(processed_at__isnull=True, order_date__isnull=False).update(processed_at=F('order_date'))
+    Orders.objects.filter(processed_at__isnull=True).update(processed_at=django.utils.timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0009_sales_rollups_revenue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orders',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='ed0efea0-43c5-433b-9c2f-b0a43075dfac', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['processed_at', 'order_date'], name='orders_process_3a7478_idx'),
+        ),
+        migrations.RunPython(mark_existing_orders_processed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0010_orders_processed_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='fbc51716-2d47-4ef8-8c43-4e4254b04227', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['customer', 'created_at'], name='shop_manage_custome_145650_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notifications',
+            index=models.Index(fields=['customer', 'read'], name='shop_manage_custome_372fe9_idx'),
+        ),
+    ]
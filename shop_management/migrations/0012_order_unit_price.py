@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0011_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orders',
+            name='unit_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='6a19ad14-923a-4582-8385-f83983794d05', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='promotions',
+            index=models.Index(fields=['end_date'], name='shop_manage_end_dat_c9d7ae_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0012_order_unit_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='products',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='shopkeepers',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shopkeepers',
+            name='rating_sum',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AlterField(
+            model_name='customsession',
+            name='session_id',
+            field=models.CharField(default='636c6990-b2c6-4b72-a0b9-6813720979ba', max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['created_by', 'rating'], name='products_created_70e89a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reviews',
+            index=models.Index(fields=['product', 'created_at'], name='shop_manage_product_2439b1_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:40
+
+from django.db import migrations
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def backfill_total_sold(apps, schema_editor):
+    # top_selling_products reads Products.total_sold, which was added with a
+    # default of 0; seed it from the orders placed so far. The hour/day/week
+    # rollups are left to reconcile_sales_counters.
+    Products = apps.get_model('shop_management', 'Products')
+    Orders = apps.get_model('shop_management', 'Orders')
+
+    sold = (
+        Orders.objects.filter(product_id=OuterRef('pk'))
+        .order_by()
+        .values('product_id')
+        .annotate(sold=Sum('quantity'))
+        .values('sold')
+    )
+    last_id = 0
+    while True:
+        ids = list(Products.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:BATCH_SIZE])
+        if not ids:
+            break
+        Products.objects.filter(id__in=ids).update(
+            total_sold=Coalesce(Subquery(sold, output_field=IntegerField()), 0)
+        )
+        last_id = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop_management', '0013_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_total_sold, migrations.RunPython.noop),
+    ]
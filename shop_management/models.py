@@ -12,6 +12,9 @@ class Shopkeepers(models.Model):
     username = models.CharField(max_length=50, db_index=True)
     shop_name = models.CharField(max_length=100,null=True, blank=True)
     rating = models.FloatField(default=0.0)
+    # review aggregates over all the shop's products, rating = sum / count
+    rating_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    rating_count = models.IntegerField(default=0)
     phone_number = models.BigIntegerField(unique = True)
     password = models.CharField(max_length=128, null=True, blank=True) 
     email = models.CharField(unique=True, max_length=100)
@@ -65,6 +68,9 @@ class Products(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, db_index=True)
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.0)
+    # maintained from Reviews by ratings.apply_review_delta, rating = sum / count
+    rating_sum = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    rating_count = models.IntegerField(default=0)
     total_sold = models.IntegerField(default=0)
     stock = models.IntegerField(default=0)
     created_by = models.ForeignKey('Shopkeepers', on_delete=models.CASCADE, related_name='products', null=True, blank=True)
@@ -77,6 +83,9 @@ class Products(models.Model):
         indexes = [
             models.Index(fields=['name', 'price']),
             models.Index(fields=['category']),
+            models.Index(fields=['created_by', 'created_at']),
+            models.Index(fields=['created_by', 'total_sold']),
+            models.Index(fields=['created_by', 'rating']),
         ]
         unique_together = ('name', 'created_by')
 
@@ -84,29 +93,69 @@ class Products(models.Model):
         return f"{self.category.name if self.category else 'No Category'} - {self.name}"
 
 
+class ProductSearchTokens(models.Model):
+    token = models.CharField(max_length=50)
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='search_tokens')
+    weight = models.IntegerField(default=1)
+
+    class Meta:
+        db_table = 'product_search_tokens'
+        unique_together = ('token', 'product')
+
+    def __str__(self):
+        return f"{self.token} -> {self.product_id} ({self.weight})"
+
+
 class Orders(models.Model):
     id = models.BigAutoField(primary_key=True)
     order_id = models.CharField(max_length=15, unique=True, null=True, blank=True)
     customer = models.ForeignKey(Customers, on_delete=models.CASCADE, null=True, blank=True)
     product = models.ForeignKey(Products, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.IntegerField()
+    # effective price per unit at placement (promotions applied)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     order_date = models.DateTimeField(blank=True, null=True, db_index=True)
     status = models.CharField(max_length=20, default='pending')
     shipping_address = models.TextField(null=True, blank=True)
     payment_method = models.CharField(max_length=50, null=True, blank=True)
     transaction_id = models.CharField(max_length=100, null=True, blank=True)
+    # set once the asynchronous side effects (notification, loyalty points,
+    # sales rollups, cache invalidation) have been applied for this order
+    processed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         db_table = 'orders'
         indexes = [
             models.Index(fields=['customer', 'product']),
             models.Index(fields=['order_date']),
+            models.Index(fields=['customer', 'order_date']),
+            models.Index(fields=['processed_at', 'order_date']),
         ]
 
     def __str__(self):
         return f"Ordered #{self.product.name} by {self.customer.username}"
 
 
+class SalesRollups(models.Model):
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='sales_rollups')
+    shopkeeper = models.ForeignKey(Shopkeepers, on_delete=models.CASCADE, null=True, blank=True)
+    period = models.CharField(max_length=10)
+    bucket = models.DateTimeField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        db_table = 'sales_rollups'
+        unique_together = ('product', 'period', 'bucket')
+        indexes = [
+            models.Index(fields=['period', 'bucket', 'units']),
+            models.Index(fields=['shopkeeper', 'period', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} sold {self.units} ({self.period} of {self.bucket:%Y-%m-%d})"
+
+
 class CustomSession(models.Model):
     session_id = models.CharField(max_length=64, unique=True, default=str(uuid.uuid4()))
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -135,6 +184,7 @@ class Reviews(models.Model):
     
     class Meta:
         unique_together = ('product', 'customer')
+        indexes = [models.Index(fields=['product', 'created_at'])]
 
     def __str__(self):
         return f"Review by {self.customer.username} for {self.product.name} ({self.rating}/5)"
@@ -152,6 +202,9 @@ class CartItems(models.Model):
     cart = models.ForeignKey(Carts, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Products, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+
+    class Meta:
+        unique_together = ('cart', 'product')
     
     def __str__(self):
         return f"{self.__class__.__name__} for {self.customer.username}"
@@ -172,6 +225,9 @@ class Promotions(models.Model):
     discount_percentage = models.IntegerField()
     start_date = models.DateTimeField()
     end_date = models.DateTimeField()
+
+    class Meta:
+        indexes = [models.Index(fields=['end_date'])]
     
     def __str__(self):
         return f"{self.__class__.__name__} for {self.customer.username}"
@@ -181,6 +237,12 @@ class Notifications(models.Model):
     message = models.TextField()
     read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'created_at']),
+            models.Index(fields=['customer', 'read']),
+        ]
     
     def __str__(self):
         return f"{self.__class__.__name__} for {self.customer.username}"
@@ -0,0 +1,79 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Customers, Notifications
+
+FAN_OUT_CHUNK_SIZE = getattr(settings, 'NOTIFICATION_CHUNK_SIZE', 1000)
+# the counter is kept exact by incr/decr, the TTL only bounds how long a
+# drifted value (e.g. a lost increment while it was being seeded) can live
+UNREAD_TTL = getattr(settings, 'NOTIFICATION_UNREAD_TTL', 60 * 60)
+
+
+def _unread_key(customer_id):
+    return f'notifications_unread_customer_{customer_id}'
+
+
+def unread_count(customer_id):
+    key = _unread_key(customer_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notifications.objects.filter(customer_id=customer_id, read=False).count()
+        cache.add(key, count, timeout=UNREAD_TTL)
+    return count
+
+
+def _adjust_unread(counts):
+    for customer_id, delta in counts.items():
+        key = _unread_key(customer_id)
+        try:
+            if cache.incr(key, delta) < 0:
+                cache.delete(key)
+        except ValueError:
+            # not cached, the next unread_count() seeds it from the table
+            pass
+
+
+def create_notifications(notifications):
+    """bulk_create one chunk; unread counters move once the rows commit."""
+    Notifications.objects.bulk_create(notifications)
+    counts = Counter(notification.customer_id for notification in notifications)
+    transaction.on_commit(lambda: _adjust_unread(counts))
+
+
+def notify_customers(message, customer_ids=None):
+    """
+    Sends `message` to the given customers, or to every active customer,
+    in chunks of FAN_OUT_CHUNK_SIZE rows. Each chunk is its own transaction
+    so a large broadcast never holds one long write lock.
+    """
+    if customer_ids is None:
+        customers = Customers.objects.filter(deleted_at__isnull=True)
+    else:
+        customers = Customers.objects.filter(id__in=customer_ids)
+    customers = customers.order_by('id').values_list('id', flat=True)
+
+    last_id = 0
+    sent = 0
+    while True:
+        chunk = list(customers.filter(id__gt=last_id)[:FAN_OUT_CHUNK_SIZE])
+        if not chunk:
+            break
+        with transaction.atomic():
+            create_notifications([Notifications(customer_id=customer_id, message=message) for customer_id in chunk])
+        last_id = chunk[-1]
+        sent += len(chunk)
+    return sent
+
+
+def mark_read(customer_id, ids=None):
+    """Marks the customer's notifications (all unread, or only `ids`) read with one UPDATE."""
+    qs = Notifications.objects.filter(customer_id=customer_id, read=False)
+    if ids is not None:
+        qs = qs.filter(id__in=ids)
+    updated = qs.update(read=True)
+    if updated:
+        _adjust_unread({customer_id: -updated})
+    return updated
@@ -0,0 +1,179 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from math import ceil
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+PAGE_SIZE = 10
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def paginate_queryset(qs, page=1, page_size=PAGE_SIZE):
+    """
+    Database-level replacement for helpers.pagination_helper.
+
+    Only the requested page is fetched (LIMIT/OFFSET) and the COUNT query is
+    skipped whenever the page itself tells us where the result set ends.
+    Returns (items, total_pages, total_count); items is None for an
+    out-of-range page, same as pagination_helper.
+    """
+    page, offset = _page_offset(page, page_size)
+    items = list(qs[offset:offset + page_size])
+
+    total_count = _known_total(items, page, offset, page_size)
+    if total_count is None:
+        total_count = qs.order_by().count()
+    return _page_result(items, page, page_size, total_count)
+
+
+async def apaginate_queryset(qs, page=1, page_size=PAGE_SIZE):
+    """paginate_queryset for async views, same return value."""
+    page, offset = _page_offset(page, page_size)
+    items = [item async for item in qs[offset:offset + page_size]]
+
+    total_count = _known_total(items, page, offset, page_size)
+    if total_count is None:
+        total_count = await qs.order_by().acount()
+    return _page_result(items, page, page_size, total_count)
+
+
+def _page_offset(page, page_size):
+    page = max(page, 1)
+    return page, (page - 1) * page_size
+
+
+def _known_total(items, page, offset, page_size):
+    if 0 < len(items) < page_size or (page == 1 and not items):
+        return offset + len(items)
+    return None
+
+
+def _page_result(items, page, page_size, total_count):
+    total_pages = max(ceil(total_count / page_size), 1)
+    if page > total_pages:
+        return None, total_pages, total_count
+    return items, total_pages, total_count
+
+
+def _cursor_default(value):
+    # full precision on purpose, DjangoJSONEncoder truncates datetimes to
+    # milliseconds which would make the seek skip rows
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not cursor serializable')
+
+
+def encode_cursor(state):
+    raw = json.dumps(state, default=_cursor_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+    if not isinstance(state, dict) or not {'sort', 'key', 'id'} <= state.keys():
+        raise InvalidCursor('Invalid cursor')
+    if type(state['id']) is not int or not 0 <= state['id'] < 2 ** 63 or not isinstance(state['sort'], str):
+        raise InvalidCursor('Invalid cursor')
+    return state
+
+
+def _model_field(model, path):
+    *relations, name = path.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+
+def _cursor_key(model, field, value):
+    # cursors come from clients, the key goes through the sort field's own
+    # conversion so a forged value is a 400 and not a database error
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        raise InvalidCursor('Invalid cursor')
+    try:
+        return _model_field(model, field).to_python(value)
+    except (ValidationError, ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _seek_filter(field, descending, value, last_id):
+    # NULL sort keys are treated as the smallest value (MySQL's native order)
+    id_after = {'id__lt' if descending else 'id__gt': last_id}
+
+    if value is None:
+        after_nulls = Q(**{f'{field}__isnull': True}, **id_after)
+        return after_nulls if descending else after_nulls | Q(**{f'{field}__isnull': False})
+
+    after = Q(**{f'{field}__lt' if descending else f'{field}__gt': value}) | Q(**{field: value}, **id_after)
+    return after | Q(**{f'{field}__isnull': True}) if descending else after
+
+
+def keyset_paginate(qs, fields, sort_mapping, sort_by, cursor='', page_size=PAGE_SIZE):
+    """
+    Seek pagination on (sort key, id) for infinite scrolling.
+
+    The cursor is opaque to clients and carries the sort option it was
+    issued for, so following it keeps the original ordering. Returns
+    (items, next_cursor, sort_by); next_cursor is None on the last page.
+    """
+    qs, field, sort_by = _keyset_query(qs, fields, sort_mapping, sort_by, cursor, page_size)
+    return _keyset_result(list(qs), fields, field, sort_by, page_size)
+
+
+async def akeyset_paginate(qs, fields, sort_mapping, sort_by, cursor='', page_size=PAGE_SIZE):
+    qs, field, sort_by = _keyset_query(qs, fields, sort_mapping, sort_by, cursor, page_size)
+    return _keyset_result([row async for row in qs], fields, field, sort_by, page_size)
+
+
+def _keyset_query(qs, fields, sort_mapping, sort_by, cursor, page_size):
+    if cursor:
+        state = decode_cursor(cursor)
+        sort_by = state['sort']
+        if sort_by not in sort_mapping:
+            raise InvalidCursor('Invalid cursor')
+
+    order = sort_mapping[sort_by]
+    descending = order.startswith('-')
+    field = order.lstrip('-')
+
+    if cursor:
+        key = _cursor_key(qs.model, field, state['key'])
+        qs = qs.filter(_seek_filter(field, descending, key, state['id']))
+
+    if descending:
+        qs = qs.order_by(F(field).desc(nulls_last=True), '-id')
+    else:
+        qs = qs.order_by(F(field).asc(nulls_first=True), 'id')
+
+    return qs.values(*fields, 'id', field)[:page_size + 1], field, sort_by
+
+
+def _keyset_result(rows, fields, field, sort_by, page_size):
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor({'sort': sort_by, 'key': last[field], 'id': last['id']})
+
+    extra = {'id', field}.difference(fields)
+    for row in rows:
+        for key in extra:
+            del row[key]
+
+    return rows, next_cursor, sort_by
@@ -0,0 +1,146 @@
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from time import monotonic
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .caching import agenerations, generations, PROMOTIONS
+from .models import Promotions
+
+# Effective price = the lower of the static discount_price and the list price
+# minus the best promotion running at that moment (overlapping promotions do
+# not stack). Promotions are kept in a per-process interval index that is
+# rebuilt when the promotions generation is bumped, or at the latest every
+# PROMOTION_INDEX_TTL seconds for rows written outside the ORM.
+INDEX_TTL = getattr(settings, 'PROMOTION_INDEX_TTL', 300)
+
+CENT = Decimal('0.01')
+
+
+class PriceIndex:
+    """
+    Immutable snapshot of the promotions that have not ended yet.
+
+    Every product's timeline is cut at the start and end of its promotions
+    into segments holding the best discount of that segment, so a lookup is
+    a bisect, and the global sorted boundary list answers "when does any
+    price change next".
+    """
+
+    def __init__(self, promotions):
+        intervals = defaultdict(list)
+        for product_id, percentage, start, end in promotions:
+            percentage = min(max(percentage, 0), 100)
+            if percentage and start < end:
+                intervals[product_id].append((start.timestamp(), end.timestamp(), percentage))
+
+        self._segments = {}
+        boundaries = set()
+        for product_id, spans in intervals.items():
+            points = sorted({point for start, end, _ in spans for point in (start, end)})
+            discounts = [
+                max((pct for start, end, pct in spans if start <= point < end), default=0)
+                for point in points
+            ]
+            self._segments[product_id] = (points, discounts)
+            boundaries.update(points)
+        self._boundaries = sorted(boundaries)
+
+    def discount(self, product_id, ts):
+        segments = self._segments.get(product_id)
+        if not segments:
+            return 0
+        points, discounts = segments
+        i = bisect_right(points, ts)
+        return discounts[i - 1] if i else 0
+
+    def next_change(self, ts, product_ids=None):
+        if product_ids is None:
+            points = self._boundaries
+        else:
+            points = sorted(
+                point for product_id in product_ids for point in self._segments.get(product_id, ((), ()))[0]
+            )
+        i = bisect_right(points, ts)
+        return points[i] if i < len(points) else None
+
+
+_index = None
+_index_generation = None
+_index_deadline = 0
+_index_lock = threading.Lock()
+
+
+def _is_current(generation):
+    return _index is not None and generation == _index_generation and monotonic() < _index_deadline
+
+
+def _rebuild(generation):
+    global _index, _index_generation, _index_deadline
+    with _index_lock:
+        if not _is_current(generation):
+            rows = Promotions.objects.filter(end_date__gt=timezone.now()).values_list(
+                'product_id', 'discount_percentage', 'start_date', 'end_date'
+            )
+            _index = PriceIndex(rows)
+            _index_generation = generation
+            _index_deadline = monotonic() + INDEX_TTL
+    return _index
+
+
+def current_index():
+    generation = generations(PROMOTIONS)[0]
+    return _index if _is_current(generation) else _rebuild(generation)
+
+
+async def acurrent_index():
+    generation = (await agenerations(PROMOTIONS))[0]
+    if _is_current(generation):
+        return _index
+    return await sync_to_async(_rebuild)(generation)
+
+
+def effective_price(price, discount_price, percentage):
+    best = price if discount_price is None else min(price, discount_price)
+    if percentage:
+        promoted = (price * (100 - percentage) / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+        best = min(best, promoted)
+    return best
+
+
+def current_price(product, when=None, index=None):
+    """Effective price of a Products instance (price and discount_price loaded)."""
+    index = index or current_index()
+    ts = (when or timezone.now()).timestamp()
+    return effective_price(product.price, product.discount_price, index.discount(product.pk, ts))
+
+
+def apply_effective_prices(rows, drop=(), when=None, index=None):
+    """
+    Sets effective_price (and promotion_discount) on .values() rows carrying
+    id, price and discount_price, then removes the helper keys in `drop`.
+    """
+    index = index or current_index()
+    ts = (when or timezone.now()).timestamp()
+    for row in rows:
+        percentage = index.discount(row['id'], ts)
+        row['effective_price'] = effective_price(row['price'], row['discount_price'], percentage)
+        row['promotion_discount'] = percentage
+        for key in drop:
+            del row[key]
+    return rows
+
+
+def price_cache_timeout(timeout, product_ids=None, index=None):
+    """Caps a cache timeout so entries holding effective prices expire when a price changes."""
+    now = timezone.now().timestamp()
+    change = (index or current_index()).next_change(now, product_ids)
+    if change is None:
+        return timeout
+    # fractional on purpose, the entry ends at the change itself and not at
+    # the next whole second (django_redis sets millisecond expiries)
+    return max(min(timeout, change - now), 0.001)
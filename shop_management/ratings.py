@@ -0,0 +1,53 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from .caching import bump, CATALOGUE, shopkeeper_products
+from .models import Products, Shopkeepers
+
+# Products and Shopkeepers carry rating_sum/rating_count next to the average
+# in `rating`, so listings sort and filter on a plain indexed column. Reviews
+# move the aggregates by deltas; recompute_ratings rebuilds them in batch.
+
+CENT = Decimal('0.01')
+
+
+def average(rating_sum, rating_count):
+    if not rating_count:
+        return Decimal('0.00')
+    return (Decimal(rating_sum) / rating_count).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _apply(model, pk, delta_sum, delta_count, to_rating):
+    # lock, read, write: the average is computed from the locked row so two
+    # concurrent reviews never write an average of a stale sum
+    row = model.objects.select_for_update().filter(pk=pk).values_list('rating_sum', 'rating_count').first()
+    if row is None:
+        return
+    rating_sum = row[0] + delta_sum
+    rating_count = max(row[1] + delta_count, 0)
+    model.objects.filter(pk=pk).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=to_rating(average(rating_sum, rating_count)),
+    )
+
+
+def apply_review_delta(product_id, delta_sum, delta_count):
+    """
+    Moves a product's rating aggregates and its shopkeeper's by one review
+    insert (+rating, +1), update (+difference, 0) or delete (-rating, -1).
+    """
+    if not delta_sum and not delta_count:
+        return
+    with transaction.atomic():
+        # product before shopkeeper, always, so concurrent reviews lock in the same order
+        _apply(Products, product_id, delta_sum, delta_count, lambda avg: avg)
+        shopkeeper_id = Products.objects.filter(pk=product_id).values_list('created_by_id', flat=True).first()
+        if shopkeeper_id:
+            _apply(Shopkeepers, shopkeeper_id, delta_sum, delta_count, float)
+
+        namespaces = [CATALOGUE]
+        if shopkeeper_id:
+            namespaces.append(shopkeeper_products(shopkeeper_id))
+        transaction.on_commit(lambda: bump(*namespaces))
@@ -0,0 +1,63 @@
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SalesRollups
+
+# Products.total_sold is bumped by checkout.reserve_stock in the same UPDATE
+# as the stock decrement; the per-period rollups are written after the order
+# commits, by tasks.process_order_side_effects. Month dashboards are summed
+# from the day rows, hour rows serve the intraday view.
+PERIODS = ('hour', 'day', 'week')
+
+
+def bucket_start(period, when):
+    # same boundaries as TruncHour / TruncDay / TruncWeek in the current time zone
+    when = timezone.localtime(when)
+    if period == 'hour':
+        return when.replace(minute=0, second=0, microsecond=0)
+    day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def unit_price(order):
+    # orders placed before unit_price was recorded fall back to the static price
+    if order.unit_price is not None:
+        return order.unit_price
+    product = order.product
+    return product.discount_price if product.discount_price is not None else product.price
+
+
+def _add_sales(product_id, shopkeeper_id, period, bucket, units, revenue):
+    lookup = {'product_id': product_id, 'period': period, 'bucket': bucket}
+    changes = {'units': F('units') + units, 'revenue': F('revenue') + revenue}
+    if SalesRollups.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SalesRollups.objects.create(shopkeeper_id=shopkeeper_id, units=units, revenue=revenue, **lookup)
+    except IntegrityError:
+        # another checkout created the bucket row first
+        SalesRollups.objects.filter(**lookup).update(**changes)
+
+
+def record_sales(orders):
+    """Adds placed orders (with their product loaded) to the hour, day and week rollups."""
+    now = timezone.now()
+    totals = defaultdict(lambda: [0, Decimal('0')])
+    for order in orders:
+        product = order.product
+        for period in PERIODS:
+            line = totals[product.pk, period, bucket_start(period, order.order_date or now), product.created_by_id]
+            line[0] += order.quantity
+            line[1] += unit_price(order) * order.quantity
+
+    # fixed row order so concurrent batches lock rollup rows the same way
+    for (product_id, period, bucket, shopkeeper_id), (units, revenue) in sorted(totals.items()):
+        _add_sales(product_id, shopkeeper_id, period, bucket, units, revenue)
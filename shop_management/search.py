@@ -0,0 +1,80 @@
+import re
+from collections import Counter
+
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, When
+
+from .models import Products, ProductSearchTokens
+
+# Inverted index over product name, category name and description, kept in
+# ProductSearchTokens by signals.py. Lookups are prefix matches on the
+# (token, product) unique index, so they stay index range scans instead of
+# the LIKE '%x%' table scan that name__icontains does.
+
+TOKEN_PATTERN = re.compile(r'\w+')
+MAX_TOKEN_LENGTH = 50
+MAX_QUERY_TERMS = 5
+FIELD_WEIGHTS = (('name', 4), ('category', 2), ('description', 1))
+
+
+def tokenize(text):
+    return [token[:MAX_TOKEN_LENGTH] for token in TOKEN_PATTERN.findall((text or '').lower())]
+
+
+def product_tokens(name, category_name, description):
+    weights = Counter()
+    for (_, weight), text in zip(FIELD_WEIGHTS, (name, category_name, description)):
+        for token in set(tokenize(text)):
+            weights[token] += weight
+    return weights
+
+
+def index_products(product_ids):
+    """Rebuilds the tokens of the given products with one DELETE and one bulk INSERT."""
+    products = Products.objects.filter(id__in=product_ids).values_list('id', 'name', 'category__name', 'description')
+    rows = [
+        ProductSearchTokens(token=token, product_id=product_id, weight=weight)
+        for product_id, name, category_name, description in products
+        for token, weight in product_tokens(name, category_name, description).items()
+    ]
+    ProductSearchTokens.objects.filter(product_id__in=product_ids).delete()
+    ProductSearchTokens.objects.bulk_create(rows, batch_size=1000)
+
+
+def _search_terms(text):
+    return list(dict.fromkeys(tokenize(text)))[:MAX_QUERY_TERMS]
+
+
+def matching_products(text):
+    """
+    Subquery of product ids where every search term prefixes some token.
+    Use it as `qs.filter(id__in=...)` or `qs.filter(product__in=...)`.
+    """
+    terms = _search_terms(text)
+    if not terms:
+        return Products.objects.none().values('id')
+
+    # istartswith is LIKE 'x%' on MySQL, which can use the token index
+    qs = Products.objects.all()
+    for term in terms:
+        qs = qs.filter(id__in=ProductSearchTokens.objects.filter(token__istartswith=term).values('product_id'))
+    return qs.values('id')
+
+
+def rank_products(qs, text):
+    """Orders a Products queryset by relevance, exact token hits count double."""
+    terms = _search_terms(text)
+    if not terms:
+        return qs
+
+    any_term = Q()
+    for term in terms:
+        any_term |= Q(token__istartswith=term)
+
+    score = (
+        ProductSearchTokens.objects.filter(any_term, product=OuterRef('pk'))
+        .order_by()
+        .values('product')
+        .annotate(score=Sum(Case(When(token__in=terms, then=F('weight') * 2), default=F('weight'))))
+        .values('score')
+    )
+    return qs.annotate(search_rank=Subquery(score)).order_by('-search_rank', '-price', '-id')
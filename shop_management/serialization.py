@@ -0,0 +1,107 @@
+import datetime
+import decimal
+import json
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.duration import duration_iso_string
+from django.utils.functional import Promise
+from django.utils.timezone import is_aware
+
+try:
+    import orjson # type: ignore
+except ImportError:
+    orjson = None
+
+# Serializer behind timed_response. Values come out exactly as
+# DjangoJSONEncoder writes them (Decimal as a string, datetimes cut to
+# milliseconds with a Z suffix) so clients see the same data, only without
+# the whitespace. JSON_SERIALIZER picks the backend:
+#   'auto'    orjson when it is installed, else 'stdlib'
+#   'orjson'  orjson, non-native types through the handlers below
+#   'stdlib'  the C json encoder with the same handlers
+#   'django'  json.dumps with DjangoJSONEncoder, the old behaviour
+
+
+def _datetime(o):
+    r = o.isoformat(timespec='milliseconds' if o.microsecond else 'seconds')
+    return r[:-6] + 'Z' if r.endswith('+00:00') else r
+
+
+def _time(o):
+    if is_aware(o):
+        raise ValueError("JSON can't represent timezone-aware times.")
+    r = o.isoformat()
+    if o.microsecond:
+        r = r[:12]
+    return r
+
+
+# looked up by exact type, a dict hit instead of DjangoJSONEncoder's
+# isinstance chain for every Decimal and datetime in a page
+_HANDLERS = {
+    decimal.Decimal: str,
+    datetime.datetime: _datetime,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: _time,
+    datetime.timedelta: duration_iso_string,
+    uuid.UUID: str,
+}
+
+
+def _default(o):
+    handler = _HANDLERS.get(type(o))
+    if handler is not None:
+        return handler(o)
+    # subclasses and lazy translation strings
+    for cls, handler in _HANDLERS.items():
+        if isinstance(o, cls):
+            return handler(o)
+    if isinstance(o, Promise):
+        return str(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+_encoder = json.JSONEncoder(default=_default, separators=(',', ':'))
+
+
+def _stdlib_dumps(data):
+    return _encoder.encode(data).encode()
+
+
+def _orjson_dumps(data):
+    # orjson writes datetimes in its own format, passing them through keeps
+    # the output identical to the other backends
+    return orjson.dumps(data, default=_default, option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+def _django_dumps(data):
+    return json.dumps(data, cls=DjangoJSONEncoder).encode()
+
+
+BACKENDS = {
+    'stdlib': _stdlib_dumps,
+    'django': _django_dumps,
+}
+if orjson is not None:
+    BACKENDS['orjson'] = _orjson_dumps
+
+
+def get_backend(name=None):
+    name = name or getattr(settings, 'JSON_SERIALIZER', 'auto')
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'Unknown or unavailable JSON serializer {name!r}, choose from {sorted(BACKENDS)}')
+
+
+dumps = get_backend()
+
+
+def json_response(data, status=200):
+    """JsonResponse equivalent that serializes with the configured backend."""
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
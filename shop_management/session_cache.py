@@ -0,0 +1,176 @@
+from time import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from .caching import agenerations, bump, generations
+from .lru import TTLLRUCache
+from .models import CustomSession, Customers, Shopkeepers
+
+# Resolved sessions are cached in two tiers: a per-process LRU in front of the
+# shared cache (Redis). Both TTLs are bounded by the session's expires_at.
+# Logout, deleted sessions and saved users, shopkeepers or customers
+# (deactivated, soft deleted, superuser revoked) drop the shared entries and
+# bump the REVOKED generation, see signals.py. Local entries remember the
+# generation they were read under and are only trusted while it is current,
+# so other workers stop honouring a revoked session within
+# CACHE_GENERATION_CHECK_INTERVAL. Changes that skip signals
+# (queryset.update()) are picked up within SESSION_CACHE_SHARED_TTL.
+LOCAL_TTL = getattr(settings, 'SESSION_CACHE_LOCAL_TTL', 30)
+SHARED_TTL = getattr(settings, 'SESSION_CACHE_SHARED_TTL', 300)
+NEGATIVE_TTL = getattr(settings, 'SESSION_CACHE_NEGATIVE_TTL', 5)
+
+REVOKED = 'revoked_sessions'
+
+# session id -> (REVOKED generation, principal)
+_local = TTLLRUCache(getattr(settings, 'SESSION_CACHE_MAX_ENTRIES', 10000))
+
+_ROLE_MODELS = {
+    'superuser': User,
+    'shopkeeper': Shopkeepers,
+    'customer': Customers,
+}
+# CustomSession foreign key of each principal model
+_SESSION_FIELDS = {
+    User: 'user',
+    Shopkeepers: 'shopkeeper',
+    Customers: 'customer',
+}
+
+
+def _cache_key(session_id):
+    return f'session_principal_{session_id}'
+
+
+def _session_query(session_id):
+    return CustomSession.objects.filter(session_id=session_id).values(
+        'expires_at',
+        'user_id', 'user__username', 'user__is_active', 'user__is_superuser',
+        'shopkeeper_id', 'shopkeeper__username', 'shopkeeper__deleted_at',
+        'customer_id', 'customer__username', 'customer__deleted_at',
+    )
+
+
+def _principal(session):
+    # False marks an unknown session so repeated bad cookies are cached too
+    if not session:
+        return False
+
+    principal = {'expires_at': session['expires_at'].timestamp()}
+    if session['user_id']:
+        principal.update(
+            role='superuser',
+            id=session['user_id'],
+            username=session['user__username'],
+            is_active=session['user__is_active'],
+            is_superuser=session['user__is_superuser'],
+        )
+    elif session['shopkeeper_id']:
+        principal.update(
+            role='shopkeeper',
+            id=session['shopkeeper_id'],
+            username=session['shopkeeper__username'],
+            deleted_at=session['shopkeeper__deleted_at'],
+        )
+    elif session['customer_id']:
+        principal.update(
+            role='customer',
+            id=session['customer_id'],
+            username=session['customer__username'],
+            deleted_at=session['customer__deleted_at'],
+        )
+    else:
+        return False
+    return principal
+
+
+def _ttl(principal, cap):
+    if not principal:
+        return NEGATIVE_TTL
+    return min(cap, principal['expires_at'] - time())
+
+
+def _valid(principal):
+    if not principal or principal['expires_at'] < time():
+        return None
+    return principal
+
+
+def _local_principal(session_id, generation):
+    # None on a miss; False (an unknown session) is a hit
+    cached = _local.get(session_id)
+    if cached is None or cached[0] != generation:
+        return None
+    return cached[1]
+
+
+def resolve_session(session_id):
+    """
+    Returns the cached principal dict for a session id, or None when the
+    session does not exist or has expired.
+    """
+    generation, = generations(REVOKED)
+    principal = _local_principal(session_id, generation)
+
+    if principal is None:
+        key = _cache_key(session_id)
+        principal = cache.get(key)
+        if principal is None:
+            principal = _principal(_session_query(session_id).first())
+            ttl = _ttl(principal, SHARED_TTL)
+            if ttl >= 1:
+                cache.set(key, principal, timeout=int(ttl))
+        _local.set(session_id, (generation, principal), _ttl(principal, LOCAL_TTL))
+
+    return _valid(principal)
+
+
+async def aresolve_session(session_id):
+    # a local hit with a current generation never leaves the event loop
+    generation, = await agenerations(REVOKED)
+    principal = _local_principal(session_id, generation)
+
+    if principal is None:
+        key = _cache_key(session_id)
+        principal = await cache.aget(key)
+        if principal is None:
+            principal = _principal(await _session_query(session_id).afirst())
+            ttl = _ttl(principal, SHARED_TTL)
+            if ttl >= 1:
+                await cache.aset(key, principal, timeout=int(ttl))
+        _local.set(session_id, (generation, principal), _ttl(principal, LOCAL_TTL))
+
+    return _valid(principal)
+
+
+def invalidate_session(session_id, revoked=True):
+    """
+    Drops the cached principal of a session. revoked=False only clears the
+    entry (a new session id), without making other workers re-check theirs.
+    """
+    _local.delete(session_id)
+    cache.delete(_cache_key(session_id))
+    if revoked:
+        bump(REVOKED)
+
+
+def invalidate_principal(model, pk):
+    """Drops the cached principal of every session held by a user, shopkeeper or customer."""
+    session_ids = list(CustomSession.objects.filter(**{_SESSION_FIELDS[model]: pk}).values_list('session_id', flat=True))
+    for session_id in session_ids:
+        _local.delete(session_id)
+    cache.delete_many([_cache_key(session_id) for session_id in session_ids])
+    if session_ids:
+        bump(REVOKED)
+
+
+def principal_instance(principal):
+    """
+    Builds a model instance from the principal without touching the database.
+    Fields that were not cached are deferred and load on first access.
+    """
+    model = _ROLE_MODELS[principal['role']]
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in principal]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [principal[name] for name in names])
@@ -0,0 +1,91 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump, CATALOGUE, PROMOTIONS, shopkeeper_products
+from .models import Categories, CustomSession, Customers, Products, Promotions, Reviews, Shopkeepers
+from .ratings import apply_review_delta
+from .search import index_products
+from .session_cache import invalidate_principal, invalidate_session
+from .suggest import suggest_index
+
+SEARCH_FIELDS = {'name', 'description', 'category', 'category_id'}
+
+
+@receiver(post_save, sender=Products)
+def reindex_product(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    index_products([instance.pk])
+    suggest_index.upsert(instance.pk, instance.name, instance.total_sold)
+
+
+@receiver(post_delete, sender=Products)
+def unindex_product(sender, instance, **kwargs):
+    suggest_index.remove(instance.pk)
+
+
+@receiver(post_save, sender=Categories)
+def reindex_category_products(sender, instance, created, **kwargs):
+    if created:
+        return
+    product_ids = list(Products.objects.filter(category=instance).values_list('id', flat=True))
+    for start in range(0, len(product_ids), 1000):
+        index_products(product_ids[start:start + 1000])
+
+
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def category_changed(sender, instance, **kwargs):
+    # the categories listing is cached under CATALOGUE
+    transaction.on_commit(lambda: bump(CATALOGUE))
+
+
+@receiver(post_save, sender=Promotions)
+@receiver(post_delete, sender=Promotions)
+def promotion_changed(sender, instance, **kwargs):
+    # the product may be gone already when the promotion is deleted by cascade
+    shopkeeper_id = Products.objects.filter(pk=instance.product_id).values_list('created_by_id', flat=True).first()
+    namespaces = [PROMOTIONS, CATALOGUE]
+    if shopkeeper_id:
+        namespaces.append(shopkeeper_products(shopkeeper_id))
+    transaction.on_commit(lambda: bump(*namespaces))
+
+
+@receiver(pre_save, sender=Reviews)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._previous = None
+    if instance.pk:
+        instance._previous = Reviews.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Reviews)
+def review_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    if previous and previous[0] != instance.product_id:
+        apply_review_delta(previous[0], -previous[1], -1)
+        previous = None
+    if previous:
+        apply_review_delta(instance.product_id, instance.rating - previous[1], 0)
+    else:
+        apply_review_delta(instance.product_id, instance.rating, 1)
+
+
+@receiver(post_delete, sender=Reviews)
+def review_deleted(sender, instance, **kwargs):
+    apply_review_delta(instance.product_id, -instance.rating, -1)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Shopkeepers)
+@receiver(post_save, sender=Customers)
+def principal_saved(sender, instance, **kwargs):
+    # deactivation, a revoked superuser flag or a soft delete ends cached sessions
+    transaction.on_commit(lambda: invalidate_principal(sender, instance.pk))
+
+
+@receiver(post_delete, sender=CustomSession)
+def session_deleted(sender, instance, **kwargs):
+    # also runs for the sessions a deleted principal cascades to
+    transaction.on_commit(lambda: invalidate_session(instance.session_id))
@@ -0,0 +1,104 @@
+import heapq
+import threading
+from operator import itemgetter
+from bisect import bisect_left, insort
+from time import monotonic
+
+from django.conf import settings
+
+from .models import Products
+
+REBUILD_INTERVAL = getattr(settings, 'SUGGEST_REBUILD_INTERVAL', 300)
+MEMO_PREFIX_LENGTH = 3
+_PREFIX_END = '\U0010ffff'
+
+
+class SuggestIndex:
+    """
+    In-process typeahead index: a sorted array of (lowercased name, product id)
+    searched with bisect, ranked by total_sold.
+
+    Product saves in this process update it incrementally (see signals.py).
+    Changes made by other workers, and total_sold movements, are picked up
+    by a full rebuild every SUGGEST_REBUILD_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._products = {}
+        self._memo = {}
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def rebuild(self):
+        rows = Products.objects.values_list('id', 'name', 'total_sold').iterator(chunk_size=5000)
+        products = {pk: (name.lower(), name, total_sold) for pk, name, total_sold in rows}
+        keys = sorted((entry[0], pk) for pk, entry in products.items())
+        with self._lock:
+            self._products, self._keys, self._memo = products, keys, {}
+            self._built_at = monotonic()
+
+    def _ensure_fresh(self):
+        if self._built_at is not None and monotonic() - self._built_at < REBUILD_INTERVAL:
+            return
+        # a stale index keeps serving while one thread rebuilds it
+        if self._rebuild_lock.acquire(blocking=self._built_at is None):
+            try:
+                if self._built_at is None or monotonic() - self._built_at >= REBUILD_INTERVAL:
+                    self.rebuild()
+            finally:
+                self._rebuild_lock.release()
+
+    def _discard(self, pk):
+        entry = self._products.pop(pk, None)
+        if entry:
+            index = bisect_left(self._keys, (entry[0], pk))
+            if index < len(self._keys) and self._keys[index] == (entry[0], pk):
+                del self._keys[index]
+
+    def upsert(self, pk, name, total_sold):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._discard(pk)
+            self._products[pk] = (name.lower(), name, total_sold)
+            insort(self._keys, (name.lower(), pk))
+            self._memo = {}
+
+    def remove(self, pk):
+        if self._built_at is None:
+            return
+        with self._lock:
+            self._discard(pk)
+            self._memo = {}
+
+    def suggest(self, prefix, limit=10):
+        self._ensure_fresh()
+        prefix = prefix.lower()
+        memo_key = (prefix, limit)
+
+        with self._lock:
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+
+            keys = self._keys
+            start = bisect_left(keys, (prefix,))
+            end = bisect_left(keys, (prefix + _PREFIX_END,), start)
+
+            # the same name can exist in several shops, rank it by the best seller;
+            # ties stay in alphabetical order
+            best = {}
+            for lower_name, pk in keys[start:end]:
+                _, name, total_sold = self._products[pk]
+                if lower_name not in best or total_sold > best[lower_name][0]:
+                    best[lower_name] = (total_sold, name)
+
+            result = [name for _, name in heapq.nlargest(limit, best.values(), key=itemgetter(0))]
+            # short prefixes cover most of the index, remember them until the next change
+            if len(prefix) <= MEMO_PREFIX_LENGTH:
+                self._memo[memo_key] = result
+            return result
+
+
+suggest_index = SuggestIndex()
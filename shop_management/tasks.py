@@ -0,0 +1,105 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import bump, CATALOGUE, customer_orders, shopkeeper_products
+from .models import Customers, Notifications, Orders
+from .notifications import create_notifications, notify_customers
+from .sales import record_sales, unit_price
+
+logger = logging.getLogger(__name__)
+
+# one loyalty point for every LOYALTY_POINT_VALUE spent on an order
+LOYALTY_POINT_VALUE = getattr(settings, 'LOYALTY_POINT_VALUE', 100)
+# orders still unprocessed after this many seconds are picked up by the sweep
+PENDING_ORDER_GRACE = getattr(settings, 'PENDING_ORDER_GRACE', 300)
+
+
+@shared_task(autoretry_for=(DatabaseError,), retry_backoff=True, max_retries=5)
+def process_order_side_effects(order_ids):
+    """
+    Applies the non-critical writes of an order placement: the customer
+    notification, loyalty points, sales rollups and cache invalidation.
+
+    Orders are claimed through processed_at inside the same transaction, so a
+    redelivered or retried task never applies an order twice.
+    """
+    with transaction.atomic():
+        ids = list(
+            Orders.objects.select_for_update(skip_locked=True)
+            .filter(order_id__in=order_ids, processed_at__isnull=True)
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return 0
+
+        orders = list(
+            Orders.objects.filter(id__in=ids)
+            .select_related('product')
+            .only('id', 'order_id', 'customer_id', 'quantity', 'unit_price', 'order_date',
+                  'product__id', 'product__name', 'product__price', 'product__discount_price',
+                  'product__created_by_id')
+            .order_by('id')
+        )
+
+        create_notifications([
+            Notifications(
+                customer_id=order.customer_id,
+                message=f'Your order {order.order_id} for {order.quantity} x {order.product.name} has been placed.'
+            )
+            for order in orders
+        ])
+
+        points = defaultdict(int)
+        for order in orders:
+            points[order.customer_id] += int(unit_price(order) * order.quantity // LOYALTY_POINT_VALUE)
+        for customer_id, earned in sorted(points.items()):
+            if earned:
+                Customers.objects.filter(pk=customer_id).update(loyalyty_points=F('loyalyty_points') + earned)
+
+        record_sales(orders)
+        Orders.objects.filter(id__in=ids).update(processed_at=timezone.now())
+
+        # stock and sales figures changed for the catalogue and the owning shops
+        namespaces = {CATALOGUE}
+        namespaces.update(customer_orders(order.customer_id) for order in orders)
+        namespaces.update(shopkeeper_products(order.product.created_by_id) for order in orders)
+        transaction.on_commit(lambda: bump(*namespaces))
+
+    return len(orders)
+
+
+@shared_task
+def process_pending_orders(batch_size=500):
+    # safety net for orders whose task was never queued (broker down) or gave up retrying
+    cutoff = timezone.now() - timedelta(seconds=PENDING_ORDER_GRACE)
+    order_ids = list(
+        Orders.objects.filter(processed_at__isnull=True, order_date__lt=cutoff)
+        .order_by('order_date')
+        .values_list('order_id', flat=True)[:batch_size]
+    )
+    if order_ids:
+        logger.warning('Processing %d orders left pending', len(order_ids))
+        return process_order_side_effects(order_ids)
+    return 0
+
+
+@shared_task
+def fan_out_notification(message, customer_ids=None):
+    # not retried: chunks committed before a failure would be sent twice
+    return notify_customers(message, customer_ids)
+
+
+def dispatch_order_side_effects(orders):
+    """Queues the side effects of freshly placed orders once the checkout commits."""
+    order_ids = [order.order_id for order in orders]
+    if order_ids:
+        # robust: a broker outage must not turn a committed checkout into a 500,
+        # the pending-order sweep applies the side effects later
+        transaction.on_commit(lambda: process_order_side_effects.delay(order_ids), robust=True)
@@ -1,3 +1,836 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from time import sleep, time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django_redis.serializers.pickle import PickleSerializer # type: ignore
+
+from . import batch, caching, compression, session_cache
+from .batch import BatchError, iter_batch, parse_requests, run_batch
+from .cache_serializers import ColumnarPickleSerializer, ThresholdCompressor
+from .caching import (
+    CATALOGUE, CachedEntry, bump, cache_stats, cached_call, generations, shopkeeper_products, versioned_key,
+)
+from .checkout import OutOfStock, place_order_lines, place_single_order, reserve_stock
+from .helpers import create_session
+from .models import (
+    Categories, CustomSession, Customers, Notifications, Orders, Products, Promotions, Reviews, SalesRollups, Shopkeepers,
+)
+from .notifications import mark_read, notify_customers, unread_count
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_paginate
+from .pricing import PriceIndex, effective_price, price_cache_timeout
+from .search import matching_products, rank_products
+from .serialization import BACKENDS, get_backend
+from .session_cache import resolve_session
+from .suggest import SuggestIndex
+from .tasks import process_order_side_effects
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM)
+class ShopTestCase(TestCase):
+    # runs without Redis: the shared cache is LocMem, the per-process tiers start empty
+
+    def setUp(self):
+        cache.clear()
+        caching._l1.clear()
+        caching._l1_generations.clear()
+        session_cache._local.clear()
+
+        self.shopkeeper = Shopkeepers.objects.create(
+            username='shop', password=make_password('pw'), email='shop@example.com', phone_number=1
+        )
+        self.customer = Customers.objects.create(
+            username='buyer', password=make_password('pw'), email='buyer@example.com', phone_number=2
+        )
+        self.category = Categories.objects.create(name='Phones')
+        self.products = [
+            Products.objects.create(
+                product_id=f'PRO-{i}', name=f'Phone {i}', price=Decimal(100 + i * 10), stock=5,
+                category=self.category, created_by=self.shopkeeper,
+            )
+            for i in range(3)
+        ]
+
+    def login(self, username):
+        response = self.client.post(
+            '/api/login/', json.dumps({'username': username, 'password': 'pw'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+
+
+class SearchTests(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.galaxy = Products.objects.create(
+            product_id='PRO-G', name='Galaxy Ultra', price=Decimal('900'), category=self.category,
+            created_by=self.shopkeeper, description='android phone with a big screen',
+        )
+
+    def matches(self, text):
+        return set(Products.objects.filter(id__in=matching_products(text)).values_list('name', flat=True))
+
+    def test_every_term_prefixes_a_token(self):
+        self.assertEqual(self.matches('gal ult'), {'Galaxy Ultra'})
+        # the category name is indexed too
+        self.assertEqual(self.matches('phones'), {'Phone 0', 'Phone 1', 'Phone 2', 'Galaxy Ultra'})
+        self.assertEqual(self.matches('galaxy tablet'), set())
+        self.assertEqual(self.matches('  %_ '), set())
+
+    def test_index_follows_renames(self):
+        self.galaxy.name = 'Pixel Pro'
+        self.galaxy.save()
+        self.assertEqual(self.matches('galaxy'), set())
+        self.assertEqual(self.matches('pixel'), {'Pixel Pro'})
+
+    def test_name_hits_rank_first(self):
+        # 'phone' is in every name but only in the galaxy's description
+        ranked = rank_products(Products.objects.filter(id__in=matching_products('phone')), 'phone')
+        self.assertEqual(list(ranked.values_list('name', flat=True))[-1], 'Galaxy Ultra')
+
+    def test_search_endpoint(self):
+        self.login('buyer')
+        response = self.client.get('/api/products/search/', {'name': 'android'})
+        self.assertEqual(response.status_code, 200)
+        products = json.loads(response.content)['data']['related_products']
+        self.assertEqual([product['name'] for product in products], ['Galaxy Ultra'])
+
+
+class SuggestTests(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        Products.objects.filter(pk=self.products[2].pk).update(total_sold=50)
+        Products.objects.filter(pk=self.products[1].pk).update(total_sold=10)
+        # the same name in another shop, ranked by its best seller
+        other = Shopkeepers.objects.create(username='other', email='other@example.com', phone_number=3)
+        Products.objects.create(name='Phone 1', price=1, created_by=other, total_sold=99)
+        Products.objects.create(name='Photo frame', price=1, created_by=self.shopkeeper, total_sold=1)
+        self.index = SuggestIndex()
+
+    def test_prefix_ranked_by_sales(self):
+        self.assertEqual(self.index.suggest('PHONE'), ['Phone 1', 'Phone 2', 'Phone 0'])
+        self.assertEqual(self.index.suggest('pho', limit=2), ['Phone 1', 'Phone 2'])
+        self.assertEqual(self.index.suggest('phot'), ['Photo frame'])
+        self.assertEqual(self.index.suggest('x'), [])
+
+    def test_upserts_and_removals_reach_memoized_prefixes(self):
+        self.assertEqual(self.index.suggest('pho', limit=1), ['Phone 1'])
+        self.index.upsert(self.products[0].pk, 'Phoenix', 500)
+        self.assertEqual(self.index.suggest('pho', limit=1), ['Phoenix'])
+        self.index.remove(self.products[0].pk)
+        self.assertNotIn('Phoenix', self.index.suggest('pho'))
+
+    def test_suggest_endpoint(self):
+        self.login('buyer')
+        self.assertEqual(self.client.get('/api/products/suggest/').status_code, 400)
+        # the shared index may have been built from another test's rows
+        with mock.patch('shop_management.views.suggest_index', self.index):
+            response = self.client.get('/api/products/suggest/', {'q': 'photo'})
+        self.assertEqual(json.loads(response.content)['data']['suggestions'], ['Photo frame'])
+
+
+class PricingTests(ShopTestCase):
+
+    def test_best_promotion_wins_without_stacking(self):
+        start = datetime(2024, 5, 1, tzinfo=dt_timezone.utc)
+        index = PriceIndex([
+            (1, 10, start, start + timedelta(days=10)),
+            (1, 30, start + timedelta(days=2), start + timedelta(days=4)),
+        ])
+        at = lambda days: (start + timedelta(days=days)).timestamp()
+        self.assertEqual([index.discount(1, at(day)) for day in (-1, 1, 3, 5, 11)], [0, 10, 30, 10, 0])
+        self.assertEqual(index.discount(2, at(3)), 0)
+        self.assertEqual(index.next_change(at(3)), at(4))
+        self.assertIsNone(index.next_change(at(11)))
+
+    def test_effective_price(self):
+        self.assertEqual(effective_price(Decimal('100'), None, 25), Decimal('75.00'))
+        self.assertEqual(effective_price(Decimal('100'), Decimal('70'), 25), Decimal('70'))
+        self.assertEqual(effective_price(Decimal('99.99'), None, 33), Decimal('66.99'))
+
+    def test_cache_timeout_ends_at_the_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Promotions.objects.create(
+                product=self.products[0], discount_percentage=50,
+                start_date=timezone.now() + timedelta(seconds=30), end_date=timezone.now() + timedelta(hours=1),
+            )
+        self.assertLess(price_cache_timeout(3600), 30)
+        self.assertGreater(price_cache_timeout(3600), 29)
+        self.assertEqual(price_cache_timeout(10), 10)
+
+    def test_listing_switches_price_at_promotion_start(self):
+        self.login('shop')
+        # not on a whole second, so rounding the timeout up would overshoot the change
+        starts = timezone.now() + timedelta(seconds=1.5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Promotions.objects.create(
+                product=self.products[0], discount_percentage=50, start_date=starts, end_date=starts + timedelta(hours=1),
+            )
+
+        def price():
+            rows = json.loads(self.client.get('/api/list_products/').content)['data']['your_products']
+            return next(row['effective_price'] for row in rows if row['product_id'] == 'PRO-0')
+
+        self.assertEqual(price(), '100.00')
+        sleep(max((starts - timezone.now()).total_seconds(), 0) + 0.05)
+
+        # at the boundary another worker holds the refresh lock: the old
+        # price must not be served, nor kept in the body cache
+        key = versioned_key(
+            f'products_user_{self.shopkeeper.id}_cat_None_search__rating_None_sort_created_at_page_1',
+            shopkeeper_products(self.shopkeeper.id),
+        )
+        cache.set(f'{key}_lock', 'another worker', 30)
+        with mock.patch.object(caching, 'LOCK_WAIT', 0.2):
+            self.assertEqual(price(), '50.00')
+        self.assertEqual(price(), '50.00')
+
+
+class AsyncViewTests(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        place_single_order(self.customer, self.products[0], 1)
+        self.sessions = {
+            'customer': {'CUSTOMER_SESSIONID': create_session(self.customer, 'customer').session_id},
+            'shopkeeper': {'SHOPKEEPER_SESSIONID': create_session(self.shopkeeper, 'shopkeeper').session_id},
+            'anonymous': {},
+        }
+
+    def payload(self, response):
+        data = json.loads(response.content)
+        data.pop('time_taken', None)
+        data.pop('api_name', None)
+        return response.status_code, data
+
+    async def test_same_responses_as_the_sync_views(self):
+        for role, url in (
+            ('customer', 'products/search/?name=phone'),
+            ('anonymous', 'products/search/?name=phone'),
+            ('shopkeeper', 'list_products/?sort=price_desc'),
+            ('shopkeeper', 'list_products/?cursor=&sort=price_asc'),
+            ('shopkeeper', 'list_products/?cursor=bad'),
+            ('anonymous', 'categories/'),
+            ('customer', 'list_orders/'),
+            ('customer', 'orders/recent/'),
+            ('customer', 'orders/today/'),
+            ('shopkeeper', 'list_orders/'),
+        ):
+            self.client.cookies.clear()
+            self.client.cookies.load(self.sessions[role])
+            self.async_client.cookies.clear()
+            self.async_client.cookies.load(self.sessions[role])
+            expected = self.payload(await sync_to_async(self.client.get)(f'/api/{url}'))
+            self.assertEqual(self.payload(await self.async_client.get(f'/api/async/{url}')), expected, (role, url))
+
+
+class BatchTests(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.cookies.load({'SHOPKEEPER_SESSIONID': create_session(self.shopkeeper, 'shopkeeper').session_id})
+
+    async def post_batch(self, requests, **options):
+        return await self.async_client.post(
+            '/api/fetch_responses/', json.dumps({'requests': requests, **options}), content_type='application/json'
+        )
+
+    # Sub-requests run sync views on their own threads, which cannot read the
+    # test transaction; the direct requests warm the caches they are served from.
+    async def test_in_process_sub_requests(self):
+        direct = json.loads((await self.async_client.get('/api/list_products/?sort=price_asc')).content)
+        response = await self.post_batch([
+            {'method': 'GET', 'url': '/api/list_products/', 'params': {'sort': 'price_asc'}},
+            {'method': 'GET', 'url': '/api/nowhere/'},
+            {'method': 'GET', 'url': '/api/fetch_responses/'},
+            {'method': 'PATCH', 'url': '/api/categories/'},
+        ])
+        results = json.loads(response.content)['results']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2, 3])
+        self.assertEqual([result['status'] for result in results], [200, 404, 400, 405])
+        self.assertEqual(results[0]['data']['data'], direct['data'])
+
+    def test_validation(self):
+        for requests, message in (
+            ([], 'No requests provided'),
+            ([{'method': 'GET'}], "Each request must have 'method' and 'url'"),
+            ([{'method': 'GET', 'url': '/', 'timeout': 'nan'}], 'timeout'),
+            ([{'method': 'GET', 'url': '/', 'timeout': -1}], 'timeout'),
+            ([{'method': 'GET', 'url': '/', 'timeout': 'inf'}], 'timeout'),
+            ([{'method': 'GET', 'url': '/'}] * (batch.MAX_REQUESTS + 1), 'At most'),
+        ):
+            with self.assertRaisesMessage(BatchError, message):
+                parse_requests(requests)
+        # a sub-request may shorten its timeout, never lengthen it
+        self.assertEqual(parse_requests([{'method': 'get', 'url': '/', 'timeout': 1e9}])[0], ('GET', '/', None, None, batch.REQUEST_TIMEOUT))
+
+    async def test_timeouts_failures_and_concurrency(self):
+        running = []
+        peak = []
+
+        async def dispatch(request, method, url, params=None, body=None):
+            running.append(url)
+            peak.append(len(running))
+            try:
+                if url == '/slow/':
+                    await asyncio.sleep(1)
+                if url == '/broken/':
+                    raise RuntimeError('view failed')
+                return 200, url
+            finally:
+                running.remove(url)
+
+        requests = parse_requests([
+            {'method': 'GET', 'url': '/slow/', 'timeout': 0.1},
+            {'method': 'GET', 'url': '/broken/'},
+            *({'method': 'GET', 'url': f'/fast/{i}/'} for i in range(6)),
+        ])
+        with mock.patch.object(batch, 'dispatch', dispatch), mock.patch.object(batch, 'CONCURRENCY', 2), \
+                self.assertLogs('shop_management.batch', 'ERROR'):
+            results = await run_batch(RequestFactory().get('/'), requests)
+
+        self.assertEqual([result['status'] for result in results], [504, 500] + [200] * 6)
+        self.assertEqual(results[2]['data'], '/fast/0/')
+        self.assertLessEqual(max(peak), 2)
+
+    async def test_batch_deadline(self):
+        async def dispatch(request, method, url, params=None, body=None):
+            await asyncio.sleep(1)
+            return 200, url
+
+        requests = parse_requests([{'method': 'GET', 'url': f'/slow/{i}/'} for i in range(3)])
+        with mock.patch.object(batch, 'dispatch', dispatch), mock.patch.object(batch, 'BATCH_TIMEOUT', 0.1):
+            entries = [entry async for entry in iter_batch(RequestFactory().get('/'), requests)]
+        self.assertEqual(sorted(entry['index'] for entry in entries), [0, 1, 2])
+        self.assertEqual({entry['status'] for entry in entries}, {504})
+
+    async def test_streaming(self):
+        await self.async_client.get('/api/categories/')
+        await self.async_client.get('/api/list_products/')
+        response = await self.post_batch([
+            {'method': 'GET', 'url': '/api/categories/'},
+            {'method': 'GET', 'url': '/api/list_products/'},
+            {'method': 'GET', 'url': '/api/nowhere/'},
+        ], stream=True)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        entries = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual({entry['index']: entry['status'] for entry in entries}, {0: 200, 1: 200, 2: 404})
+
+
+class SerializationTests(TestCase):
+
+    payload = {
+        'price': Decimal('199.90'),
+        'rating': Decimal('4.5'),
+        'created_at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'updated_at': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone(timedelta(hours=5, minutes=30))),
+        'delivery': date(2024, 5, 3),
+        'window': timedelta(days=1, seconds=90),
+        'reference': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'lines': [{'quantity': 2, 'subtotal': Decimal('399.80'), 'name': 'Phöne'}, None, True, 1.5],
+    }
+
+    def test_backends_match_django_encoder(self):
+        expected = json.loads(json.dumps(self.payload, cls=DjangoJSONEncoder))
+        self.assertEqual(expected['price'], '199.90')
+        self.assertEqual(expected['created_at'], '2024-05-01T12:30:15.123Z')
+        for name, dumps in BACKENDS.items():
+            with self.subTest(backend=name):
+                self.assertEqual(json.loads(dumps(self.payload)), expected)
+
+    def test_unsupported_values(self):
+        for name, dumps in BACKENDS.items():
+            with self.subTest(backend=name), self.assertRaises(TypeError):
+                dumps({'value': object()})
+
+    def test_get_backend(self):
+        self.assertIs(get_backend('stdlib'), BACKENDS['stdlib'])
+        self.assertIn(get_backend('auto'), (BACKENDS['stdlib'], BACKENDS.get('orjson')))
+        with override_settings(JSON_SERIALIZER='django'):
+            self.assertIs(get_backend(), BACKENDS['django'])
+        with self.assertRaisesMessage(ValueError, "Unknown or unavailable JSON serializer 'yaml'"):
+            get_backend('yaml')
+
+
+class CheckoutTests(ShopTestCase):
+
+    def test_reserve_stock(self):
+        product = self.products[0]
+        self.assertTrue(reserve_stock(product.pk, 3))
+        self.assertFalse(reserve_stock(product.pk, 3))
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.total_sold), (2, 3))
+
+    def test_place_single_order_out_of_stock(self):
+        with self.assertRaises(OutOfStock):
+            place_single_order(self.customer, self.products[0], 6)
+        self.assertFalse(Orders.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 5)
+
+    def test_order_lines_partial(self):
+        lines = [(self.products[0], 2), (self.products[1], 10)]
+        placed, outcomes = place_order_lines(self.customer, lines)
+        self.assertEqual(len(placed), 1)
+        self.assertEqual([outcome['status'] for outcome in outcomes], ['placed', 'out_of_stock'])
+        self.assertEqual(Orders.objects.count(), 1)
+
+    def test_order_lines_all_or_nothing_rolls_back(self):
+        lines = [(self.products[0], 2), (self.products[1], 10)]
+        placed, outcomes = place_order_lines(self.customer, lines, all_or_nothing=True)
+        self.assertEqual(placed, [])
+        self.assertEqual(outcomes, [{'status': 'rolled_back'}, {'status': 'out_of_stock'}])
+        self.assertFalse(Orders.objects.exists())
+        self.products[0].refresh_from_db()
+        self.assertEqual((self.products[0].stock, self.products[0].total_sold), (5, 0))
+
+
+class SessionCacheTests(ShopTestCase):
+
+    def other_worker(self, session_id, change):
+        # another process: its local entry survives the change, only its
+        # copy of the generation runs out (CACHE_GENERATION_CHECK_INTERVAL)
+        local_entry = session_cache._local.get(session_id)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        session_cache._local.set(session_id, local_entry, 30)
+        caching._l1_generations.clear()
+
+    def test_logout_reaches_other_workers(self):
+        session_id = create_session(self.customer, 'customer').session_id
+        self.assertEqual(resolve_session(session_id)['username'], 'buyer')
+
+        self.other_worker(session_id, lambda: CustomSession.objects.filter(session_id=session_id).delete())
+        self.assertIsNone(resolve_session(session_id))
+
+    def test_soft_delete_reaches_other_workers(self):
+        session_id = create_session(self.customer, 'customer').session_id
+        resolve_session(session_id)
+
+        def soft_delete():
+            self.customer.deleted_at = timezone.now()
+            self.customer.save()
+
+        self.other_worker(session_id, soft_delete)
+        self.assertIsNotNone(resolve_session(session_id)['deleted_at'])
+
+
+class OrderSideEffectTests(ShopTestCase):
+
+    def test_side_effects_apply_once(self):
+        order = place_single_order(self.customer, self.products[2], 2)
+
+        self.assertEqual(process_order_side_effects([order.order_id]), 1)
+        # a redelivered or retried task finds the order claimed
+        self.assertEqual(process_order_side_effects([order.order_id]), 0)
+
+        order.refresh_from_db()
+        self.assertIsNotNone(order.processed_at)
+        self.assertEqual(Notifications.objects.filter(customer=self.customer).count(), 1)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalyty_points, 2)
+
+    def test_reconcile_leaves_pending_orders_to_the_task(self):
+        order = place_single_order(self.customer, self.products[0], 3)
+        call_command('reconcile_sales_counters', stdout=StringIO())
+        self.assertFalse(SalesRollups.objects.exists())
+
+        process_order_side_effects([order.order_id])
+        self.assertEqual(SalesRollups.objects.get(period='day').units, 3)
+        call_command('reconcile_sales_counters', stdout=StringIO())
+        self.assertEqual(SalesRollups.objects.get(period='day').units, 3)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].total_sold, 3)
+
+
+class SalesDashboardTests(ShopTestCase):
+
+    def setUp(self):
+        super().setUp()
+        orders = [
+            place_single_order(self.customer, self.products[0], 2),
+            place_single_order(self.customer, self.products[1], 1),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            process_order_side_effects([order.order_id for order in orders])
+        self.login('shop')
+
+    def dashboard(self, **params):
+        return self.client.get('/api/dashboard/sales/', params)
+
+    def test_totals_from_rollups(self):
+        for granularity in ('hour', 'day', 'week', 'month'):
+            data = json.loads(self.dashboard(granularity=granularity).content)['data']
+            self.assertEqual((data['total_units'], Decimal(data['total_revenue'])), (3, Decimal('310')), granularity)
+            self.assertEqual(len(data['buckets']), 1, granularity)
+
+        data = json.loads(self.dashboard(product_id='PRO-1').content)['data']
+        self.assertEqual((data['total_units'], Decimal(data['total_revenue'])), (1, Decimal('110')))
+
+    def test_new_orders_show_up(self):
+        self.dashboard()
+        order = place_single_order(self.customer, self.products[2], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            process_order_side_effects([order.order_id])
+        self.assertEqual(json.loads(self.dashboard().content)['data']['total_units'], 4)
+
+    def test_invalid_ranges(self):
+        for params in (
+            {'granularity': 'year'},
+            {'from': '2024-13-01'},
+            {'from': 'yesterday'},
+            {'from': '2024-05-02', 'to': '2024-05-01'},
+            {'granularity': 'hour', 'from': '2024-01-01', 'to': '2024-03-01'},
+        ):
+            self.assertEqual(self.dashboard(**params).status_code, 400, params)
+
+
+class NotificationTests(ShopTestCase):
+
+    def test_fan_out_in_chunks_and_unread_counts(self):
+        Customers.objects.create(username='other', email='other@example.com', phone_number=3)
+        self.assertEqual(unread_count(self.customer.id), 0)
+        with mock.patch('shop_management.notifications.FAN_OUT_CHUNK_SIZE', 1), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notify_customers('hello'), 2)
+        self.assertEqual(unread_count(self.customer.id), 1)
+
+        self.assertEqual(mark_read(self.customer.id), 1)
+        self.assertEqual(unread_count(self.customer.id), 0)
+
+    def test_broadcast_validates_customer_ids(self):
+        User.objects.create_superuser('root', 'root@example.com', 'pw')
+        self.login('root')
+        with mock.patch('shop_management.views.fan_out_notification.delay') as delay:
+            for customer_ids in ('1', ['abc'], [None], [{}]):
+                response = self.client.post(
+                    '/api/notifications/broadcast/', json.dumps({'message': 'hi', 'customer_ids': customer_ids}),
+                    content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 400, customer_ids)
+            delay.assert_not_called()
+
+            response = self.client.post(
+                '/api/notifications/broadcast/', json.dumps({'message': 'hi', 'customer_ids': ['1', 2]}),
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            delay.assert_called_once_with('hi', [1, 2])
+
+
+class RatingTests(ShopTestCase):
+
+    def assertRating(self, rating_sum, rating_count, rating):
+        product = Products.objects.get(pk=self.products[0].pk)
+        self.assertEqual((product.rating_sum, product.rating_count, product.rating), (rating_sum, rating_count, rating))
+
+    def test_review_deltas(self):
+        other = Customers.objects.create(username='other', email='other@example.com', phone_number=3)
+        review = Reviews.objects.create(product=self.products[0], customer=self.customer, rating=Decimal('4'))
+        Reviews.objects.create(product=self.products[0], customer=other, rating=Decimal('5'))
+        self.assertRating(Decimal('9'), 2, Decimal('4.50'))
+
+        review.rating = Decimal('2')
+        review.save()
+        self.assertRating(Decimal('7'), 2, Decimal('3.50'))
+
+        review.delete()
+        self.assertRating(Decimal('5'), 1, Decimal('5.00'))
+        self.shopkeeper.refresh_from_db()
+        self.assertEqual((self.shopkeeper.rating_count, self.shopkeeper.rating), (1, 5.0))
+
+    def test_review_moved_to_another_product(self):
+        review = Reviews.objects.create(product=self.products[0], customer=self.customer, rating=Decimal('4'))
+        review.product = self.products[1]
+        review.save()
+        self.assertRating(Decimal('0'), 0, Decimal('0'))
+        self.assertEqual(Products.objects.get(pk=self.products[1].pk).rating_count, 1)
+
+
+class CursorTests(ShopTestCase):
+
+    def test_round_trip(self):
+        state = {'sort': 'created_at', 'key': datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc), 'id': 7}
+        decoded = decode_cursor(encode_cursor(state))
+        # full precision, not truncated to milliseconds
+        self.assertEqual(decoded['key'], '2024-05-01T12:00:00.123456+00:00')
+        self.assertEqual(decode_cursor(encode_cursor({'sort': 'price', 'key': Decimal('1.10'), 'id': 1}))['key'], '1.10')
+
+    def test_invalid_cursors(self):
+        for cursor in ('not a cursor', encode_cursor([1, 2]), encode_cursor({'sort': 'price'})):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+        qs = Products.objects.all()
+        with self.assertRaises(InvalidCursor):
+            keyset_paginate(qs, ('name',), {'price_asc': 'price'}, 'price_asc', encode_cursor({'sort': 'nope', 'key': 1, 'id': 1}))
+
+    def test_forged_values(self):
+        sorts = {'price_asc': 'price', 'created_at': '-created_at'}
+        for state in (
+            {'sort': 'created_at', 'key': '2024-05-01T12:00:00+00:00', 'id': 'abc'},
+            {'sort': 'created_at', 'key': 'yesterday', 'id': 1},
+            {'sort': 'price_asc', 'key': {'a': 1}, 'id': 1},
+            {'sort': 'price_asc', 'key': 'NaN', 'id': 1},
+            {'sort': 'price_asc', 'key': '1', 'id': 2 ** 70},
+        ):
+            with self.assertRaises(InvalidCursor, msg=state):
+                keyset_paginate(Products.objects.all(), ('name',), sorts, 'price_asc', encode_cursor(state))
+
+    def test_forged_cursor_is_a_400(self):
+        self.login('buyer')
+        cursor = encode_cursor({'sort': 'price_asc', 'key': 'abc', 'id': 1})
+        response = self.client.get('/api/list_orders/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 400)
+
+    def test_pages_cover_every_row_once(self):
+        # equal sort keys, so the id tie-break decides
+        Products.objects.update(price=Decimal('100'))
+        seen = []
+        cursor = ''
+        while True:
+            rows, cursor, sort_by = keyset_paginate(Products.objects.all(), ('name',), {'price_desc': '-price'}, 'price_desc', cursor, page_size=2)
+            seen.extend(row['name'] for row in rows)
+            self.assertEqual(sort_by, 'price_desc')
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), ['Phone 0', 'Phone 1', 'Phone 2'])
+
+
+class CachedCallTests(ShopTestCase):
+
+    def producer(self, value):
+        return mock.Mock(return_value=value)
+
+    def test_fresh_entry_is_not_rebuilt(self):
+        producer = self.producer('new')
+        cache.set('key', CachedEntry('cached', time() + 60, 0), 60)
+        self.assertEqual(cached_call('key', producer, 60), 'cached')
+        producer.assert_not_called()
+
+    def test_cold_miss_fills_and_releases_lock(self):
+        self.assertEqual(cached_call('key', self.producer('value'), 60), 'value')
+        self.assertEqual(cache.get('key').value, 'value')
+        self.assertIsNone(cache.get('key_lock'))
+
+    def test_stale_entry_served_while_locked(self):
+        producer = self.producer('new')
+        cache.set('key', CachedEntry('old', time() - 1, 0), 60)
+        cache.set('key_lock', 'another worker', 30)
+        self.assertEqual(cached_call('key', producer, 60), 'old')
+        producer.assert_not_called()
+
+    def test_stale_entry_refreshed_by_lock_holder(self):
+        cache.set('key', CachedEntry('old', time() - 1, 0), 60)
+        self.assertEqual(cached_call('key', self.producer('new'), 60), 'new')
+        self.assertIsNone(cache.get('key_lock'))
+
+    def test_failed_refresh_serves_stale_value(self):
+        cache.set('key', CachedEntry('old', time() - 1, 0), 60)
+        producer = mock.Mock(side_effect=RuntimeError('database down'))
+        with self.assertLogs('shop_management.caching', 'ERROR'):
+            self.assertEqual(cached_call('key', producer, 60), 'old')
+        self.assertIsNone(cache.get('key_lock'))
+
+    def test_expired_entry_never_served_without_stale(self):
+        cache.set('key', CachedEntry('old price', time() - 1, 0), 60)
+        cache.set('key_lock', 'another worker', 30)
+        with mock.patch.object(caching, 'LOCK_WAIT', 0.1):
+            self.assertEqual(cached_call('key', self.producer('new price'), 60, stale=False), 'new price')
+
+        cache.set('key', CachedEntry('old price', time() - 1, 0), 60)
+        cache.delete('key_lock')
+        with self.assertRaises(RuntimeError):
+            cached_call('key', mock.Mock(side_effect=RuntimeError('database down')), 60, stale=False)
+
+    def test_lock_released_only_by_its_holder(self):
+        cache.set('key_lock', 'next holder', 30)
+        caching._release('key_lock', 'expired holder')
+        self.assertEqual(cache.get('key_lock'), 'next holder')
+
+    def test_redis_release_is_one_script_call(self):
+        client = mock.Mock()
+        with mock.patch.object(caching, 'cache', mock.Mock(client=client)):
+            caching._release('key_lock', 'token')
+        client.get_client.return_value.eval.assert_called_once_with(
+            caching.RELEASE_SCRIPT, 1, client.make_key.return_value, client.encode.return_value
+        )
+        client.make_key.assert_called_once_with('key_lock')
+        client.encode.assert_called_once_with('token')
+
+
+class L1CacheTests(ShopTestCase):
+
+    def test_local_hit_skips_shared_cache(self):
+        producer = mock.Mock(return_value='value')
+        self.assertEqual(cached_call('key', producer, 60, local=True), 'value')
+        before = cache_stats()
+        with mock.patch.object(caching, 'shared_get', side_effect=AssertionError('shared cache read')):
+            self.assertEqual(cached_call('key', producer, 60, local=True), 'value')
+        after = cache_stats()
+        self.assertEqual(after['l1_hits'], before['l1_hits'] + 1)
+        self.assertEqual(after['l2_hits'] + after['l2_misses'], before['l2_hits'] + before['l2_misses'])
+        producer.assert_called_once()
+
+        # without local=True every read goes to the shared cache
+        cached_call('key', producer, 60)
+        self.assertEqual(cache_stats()['l2_hits'], after['l2_hits'] + 1)
+
+    def test_local_copy_expires_with_entry(self):
+        cache.set('key', CachedEntry('value', time() + 0.2, 0), 60)
+        self.assertEqual(cached_call('key', mock.Mock(return_value='new'), 60, local=True), 'value')
+        self.assertIsNotNone(caching.local_get('key'))
+        sleep(0.25)
+        self.assertIsNone(caching.local_get('key'))
+
+    def test_local_generations(self):
+        with mock.patch.object(caching, 'GENERATION_CHECK_INTERVAL', 0.2):
+            generation, = generations(CATALOGUE)
+            # another process bumps: seen here once the local copy expires
+            cache.incr(caching._generation_key(CATALOGUE))
+            self.assertEqual(generations(CATALOGUE), [generation])
+            sleep(0.25)
+            self.assertEqual(generations(CATALOGUE), [generation + 1])
+
+            # this process bumps: seen at once
+            bump(CATALOGUE)
+            self.assertEqual(generations(CATALOGUE), [generation + 2])
+
+
+class ConditionalListingTests(ShopTestCase):
+
+    def test_not_modified_until_data_changes(self):
+        self.login('shop')
+        response = self.client.get('/api/list_products/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get('/api/list_products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        bump(shopkeeper_products(self.shopkeeper.id))
+        response = self.client.get('/api/list_products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class BodyCacheTests(ShopTestCase):
+
+    def test_negotiate(self):
+        factory = RequestFactory()
+        with mock.patch.object(compression, 'PREFERENCE', ['br', 'gzip']):
+            for header, expected in (
+                ('', 'identity'),
+                ('gzip, deflate', 'gzip'),
+                ('gzip, br', 'br'),
+                ('br;q=0, gzip;q=0.5', 'gzip'),
+                ('br;q=oops, gzip', 'gzip'),
+                ('*', 'br'),
+                ('*;q=0, GZIP', 'gzip'),
+                ('deflate', 'identity'),
+            ):
+                with self.subTest(header=header):
+                    self.assertEqual(compression.negotiate(factory.get('/', HTTP_ACCEPT_ENCODING=header)), expected)
+
+    def test_encode(self):
+        small = b'{"data":[]}'
+        self.assertEqual(compression.encode(small, 'gzip'), (small, 'identity'))
+        body = json.dumps({'data': [{'name': 'Phone', 'price': '100.00'}] * 50}).encode()
+        self.assertEqual(compression.encode(body, 'identity'), (body, 'identity'))
+        content, encoding = compression.encode(body, 'gzip')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(content), body)
+
+    def test_compressed_body_is_cached(self):
+        self.login('shop')
+        response = self.client.get('/api/list_products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].startswith('W/'))
+        first = json.loads(gzip.decompress(response.content))
+        self.assertIn('PRO-0', json.dumps(first))
+
+        # the hit is the stored body, time_taken included, and skips the query
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/list_products/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.content)), first)
+
+        response = self.client.get('/api/list_products/')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertFalse(response['ETag'].startswith('W/'))
+        self.assertEqual(json.loads(response.content)['data'], first['data'])
+
+    def test_stale_page_body_is_not_kept(self):
+        self.login('buyer')
+        self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+        key = versioned_key('categories_page_1', CATALOGUE)
+        body_key = f'{key}_body_identity'
+        self.assertIsNotNone(cache.get(body_key))
+
+        # the page went stale and another worker is refreshing it
+        cache.delete(body_key)
+        cache.set(key, cache.get(key)._replace(expires_at=time() - 1), 60)
+        cache.set(f'{key}_lock', 'another worker', 30)
+        caching._l1.clear()
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Phones', response.content)
+        self.assertIsNone(cache.get(body_key))
+
+        cache.delete(f'{key}_lock')
+        caching._l1.clear()
+        self.assertEqual(self.client.get('/api/categories/').status_code, 200)
+        self.assertIsNotNone(cache.get(body_key))
+
+
+class CacheSerializerTests(TestCase):
+
+    def rows(self, count):
+        return [{
+            'id': i,
+            'name': f'Phone {i}',
+            'price': Decimal('1299.00') + i,
+            'discount_price': None if i % 2 else Decimal('999.99'),
+            'order_date': datetime(2024, 5, 1, 12, i, tzinfo=dt_timezone.utc),
+        } for i in range(count)]
+
+    def test_columnar_round_trip(self):
+        serializer = ColumnarPickleSerializer({})
+        value = CachedEntry((self.rows(20), 2, 20), time(), 0.01)
+        loaded = serializer.loads(serializer.dumps(value))
+        self.assertEqual(loaded, value)
+        self.assertIsInstance(loaded, CachedEntry)
+        self.assertIs(type(loaded.value[0]), list)
+        self.assertLess(len(serializer.dumps(value)), len(PickleSerializer({}).dumps(value)))
+
+    def test_short_lists_and_stock_pickles_load(self):
+        serializer = ColumnarPickleSerializer({})
+        for value in (self.rows(3), {'rows': self.rows(10)}, 'plain'):
+            self.assertEqual(serializer.loads(serializer.dumps(value)), value)
+            self.assertEqual(serializer.loads(PickleSerializer({}).dumps(value)), value)
+
+    def test_threshold_compressor(self):
+        compressor = ThresholdCompressor({'COMPRESS_MIN_LENGTH': 64})
+        small = b'\x80' + b'x' * 10
+        large = b'\x80' + b'x' * 1000
+        self.assertEqual(compressor.compress(small), small)
+        self.assertLess(len(compressor.compress(large)), len(large))
+        self.assertEqual(compressor.decompress(compressor.compress(large)), large)
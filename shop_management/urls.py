@@ -1,6 +1,7 @@
 from django.urls import path
 from . import views
 from . import helpers
+from . import async_views
 
 urlpatterns = [
 
@@ -19,16 +20,46 @@ urlpatterns = [
 
     # PRODUCTS (Shopkeeper only)
     path('products/search/', views.search_product, name ='search_product'),
+    path('products/suggest/', views.suggest_products, name='suggest_products'),
     path('products/create/', views.create_product, name='create_product'),
     path('list_products/', views.list_products, name='list_products'),
     path('products/expensive/', views.expensive_products, name='expensive_products'),
     path('products/low-stock/', views.low_stock_products, name='low_stock_products'),
     path('products/top-selling/', views.top_selling_products, name='top_selling_products'),
+    path('dashboard/sales/', views.sales_dashboard, name='sales_dashboard'),
 
     # ORDERS (Customer only)
     path('orders/create/', views.place_order, name='place_order'),
+    path('orders/bulk/', views.place_bulk_order, name='place_bulk_order'),
     path('list_orders/', views.my_orders, name='my_orders'),
     path('orders/today/', views.orders_today, name='orders_today'),
     path('orders/recent/', views.recent_orders, name='recent_orders'),
+
+    # CART (Customer only)
+    path('cart/', views.view_cart, name='view_cart'),
+    path('cart/add/', views.add_to_cart, name='add_to_cart'),
+    path('cart/update/', views.update_cart, name='update_cart'),
+    path('cart/remove/', views.remove_from_cart, name='remove_from_cart'),
+    path('cart/checkout/', views.checkout_cart, name='checkout_cart'),
+
+    # REVIEWS
+    path('reviews/', views.list_reviews, name='list_reviews'),
+    path('reviews/submit/', views.submit_review, name='submit_review'),
+    path('reviews/delete/', views.delete_review, name='delete_review'),
+
+    # ASYNC READ ENDPOINTS (same responses as above, for ASGI workers)
+    path('async/products/search/', async_views.search_product, name='async_search_product'),
+    path('async/list_products/', async_views.list_products, name='async_list_products'),
+    path('async/categories/', async_views.list_categories, name='async_list_categories'),
+    path('async/list_orders/', async_views.my_orders, name='async_my_orders'),
+    path('async/orders/recent/', async_views.recent_orders, name='async_recent_orders'),
+    path('async/orders/today/', async_views.orders_today, name='async_orders_today'),
+
+    # NOTIFICATIONS
+    path('notifications/', views.list_notifications, name='list_notifications'),
+    path('notifications/unread-count/', views.notifications_unread_count, name='notifications_unread_count'),
+    path('notifications/mark-read/', views.mark_notifications_read, name='mark_notifications_read'),
+    path('notifications/broadcast/', views.broadcast_notification, name='broadcast_notification'),
+    path('cache/stats/', views.view_cache_stats, name='cache_stats'),
     
 ]
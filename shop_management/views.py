@@ -1,13 +1,33 @@
 import uuid
 import json
-from datetime import timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from datetime import datetime, time, timedelta
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.http import JsonResponse
-from django.db.models import Sum, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Prefetch, Sum
+from django.db.models.functions import TruncMonth
+from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from .models import Customers, Shopkeepers, Products, Orders, Categories,CustomSession
+from django.views.decorators.http import condition
+from .models import Customers, Shopkeepers, Products, CustomSession, Carts, CartItems, SalesRollups, Notifications, Reviews
 from django.core.cache import cache
 from shop_management.helpers import authenticate_user,timed_response, create_session, _authorize_shopkeeper, _authorize_customer,_authorize_superuser, pagination_helper
+from shop_management.pagination import paginate_queryset, keyset_paginate, InvalidCursor
+from shop_management.session_cache import invalidate_session
+from shop_management.checkout import place_single_order, place_order_lines, OutOfStock
+from shop_management.search import matching_products
+from shop_management.suggest import suggest_index
+from shop_management.caching import versioned_key, bump, cached_call, cache_stats, CATALOGUE, PROMOTIONS, shopkeeper_products
+from shop_management.sales import PERIODS, bucket_start
+from shop_management.notifications import unread_count, mark_read
+from shop_management.pricing import price_cache_timeout, current_index, effective_price
+from shop_management.listings import (
+    run_listing, priced_page, search_listing, product_listing, category_listing,
+    my_orders_listing, recent_orders_listing, orders_today_listing
+)
+from shop_management.tasks import fan_out_notification
 from django.contrib.auth.hashers import make_password
 
 @csrf_exempt
@@ -72,6 +92,7 @@ def logout_view(request):
     if "SHOPKEEPER_SESSIONID" in request.COOKIES:
         session_id = request.COOKIES.get("SHOPKEEPER_SESSIONID")
         deleted_count = CustomSession.objects.filter(session_id=session_id, shopkeeper__isnull=False).delete()[0]
+        invalidate_session(session_id)
         response = JsonResponse({'message': f'Shopkeeper {request.shopkeeper.username} logged out successfully'} if deleted_count else {'error': 'No active session found'})
         response.delete_cookie("SHOPKEEPER_SESSIONID")
         return response
@@ -79,6 +100,7 @@ def logout_view(request):
     elif "CUSTOMER_SESSIONID" in request.COOKIES:
         session_id = request.COOKIES.get("CUSTOMER_SESSIONID")
         deleted_count = CustomSession.objects.filter(session_id=session_id, customer__isnull=False).delete()[0]
+        invalidate_session(session_id)
         response = JsonResponse({'message': f'Customer {request.customer.username} logged out successfully'} if deleted_count else {'error': 'No active session found'})
         response.delete_cookie("CUSTOMER_SESSIONID")
         return response
@@ -86,6 +108,7 @@ def logout_view(request):
     elif "SUPERUSER_SESSIONID" in request.COOKIES:
         session_id = request.COOKIES.get("SUPERUSER_SESSIONID")
         deleted_count = CustomSession.objects.filter(session_id=session_id, user__isnull=False).delete()[0]
+        invalidate_session(session_id)
         response = JsonResponse({'message': f'Superuser {request.user.username} logged out successfully'} if deleted_count else {'error': 'No active session found'})
         response.delete_cookie("SUPERUSER_SESSIONID")
         return response
@@ -93,7 +116,18 @@ def logout_view(request):
     return JsonResponse({'error': 'No active session found'}, status=400)
 
 
+def _active_users_etag(request):
+    # one aggregate instead of loading every session with its user: a login
+    # moves the newest created_at, a logout or an expiry changes the count
+    if request.method != 'GET':
+        return None
+    stats = CustomSession.objects.filter(expires_at__gt=timezone.now()).aggregate(count=Count('id'), latest=Max('created_at'))
+    latest = stats['latest'].timestamp() if stats['latest'] else 0
+    return f'"active-users-{stats["count"]}-{latest}"'
+
+
 @csrf_exempt
+@condition(etag_func=_active_users_etag)
 @timed_response
 def active_user(request):
     if request.method != 'GET':
@@ -258,36 +292,33 @@ def search_product(request):
         print(user)
         return JsonResponse({'error': 'You should be an authorized user'}, status=401)
 
-    name = request.GET.get('name', '').strip()
-    page = request.GET.get('page', 1)
-    try:
-        page = int(page)                 
-        if page < 1:
-            page = 1
-    except ValueError:
-        page = 1                         
-        
-    if not name:
-        return JsonResponse({'error': 'Product name required'}, status=400)
+    return run_listing(search_listing(request), request)
+
+MAX_SUGGESTIONS = 20
+
+
+@csrf_exempt
+@timed_response
+def suggest_products(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
 
-    cache_key = f'product_search_{name.lower()}'
-    related_products = cache.get(cache_key)
+    user = _authorize_shopkeeper(request) or _authorize_customer(request) or _authorize_superuser(request)
+    if not user:
+        return JsonResponse({'error': 'You should be an authorized user'}, status=401)
 
-    if not related_products:
-        related_products = Products.objects.filter(name__icontains=name).values('name', 'price', 'stock').order_by('-price')
-        if not related_products:
-            return JsonResponse({'error': 'No products found for your search'}, status=404)
-        cache.set(cache_key, list(related_products), timeout=300)
+    prefix = request.GET.get('q', '').strip()
+    if not prefix:
+        return JsonResponse({'error': 'Search prefix required'}, status=400)
 
-    products, total_pages = pagination_helper(related_products, page)
-    if products is None:
-        return JsonResponse({'error': f'Invalid page number, total pages are {total_pages}'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), MAX_SUGGESTIONS)
+    except ValueError:
+        limit = 10
 
     return {
-        'related_products': list(products),
-        'current_page': page,
-        'total_pages': total_pages,
-        'total_products': len(related_products)
+        'prefix': prefix,
+        'suggestions': suggest_index.suggest(prefix, limit)
     }
 
 
@@ -352,6 +383,7 @@ def create_product(request):
         category=category,
         created_by=shopkeeper
     )
+    bump(shopkeeper_products(shopkeeper.id), CATALOGUE)
 
     return {
         'product_id': product_id,
@@ -372,29 +404,7 @@ def list_categories(request):
     if request.method != 'GET':
         return JsonResponse({'error': 'GET method required'}, status=405)
     
-    page = request.GET.get('page', 1)
-    try:
-        page = int(page)
-        if page < 1:
-            page = 1
-    except ValueError:
-        page = 1
-
-    categories_qs = Categories.objects.annotate(
-        product_count=Count('products')
-    ).values('name', 'description', 'product_count').order_by('-product_count', 'name')
-
-    categories_list = list(categories_qs)
-    requested_categories, total_pages = pagination_helper(categories_list, page)
-    if requested_categories is None:
-        return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
-    return {
-        'categories': requested_categories,
-        'current_page': page,
-        'total_pages': total_pages,
-        'total_categories': len(categories_list)
-    }
-
+    return run_listing(category_listing(request), request)
 
 @csrf_exempt
 @timed_response
@@ -406,57 +416,7 @@ def list_products(request):
     if not user:
         return JsonResponse({'error': 'Unauthorized'}, status=401)
 
-
-    category_name = request.GET.get('category', None)
-    search_name = request.GET.get('search', '').strip()
-    sort_by = request.GET.get('sort', 'created_at') 
-    page = request.GET.get('page', 1)
-
-    try:
-        page = int(page)
-        if page < 1:
-            page = 1
-    except ValueError:
-        page = 1
-
-    qs = Products.objects.filter(created_by=user)
-
-    if category_name:
-        qs = qs.filter(category__name__iexact=category_name)
-
-    if search_name:
-        qs = qs.filter(name__icontains=search_name)
-
-    sort_mapping = {
-        'price_asc': 'price',
-        'price_desc': '-price',
-        'rating': '-rating',
-        'stock': '-stock',
-        'created_at': '-created_at',
-    }
-    qs = qs.order_by(sort_mapping.get(sort_by, '-created_at'))
-
-    cache_key = f'products_user_{user.id}_cat_{category_name}_search_{search_name}_sort_{sort_by}_page_{page}'
-    cached_products = cache.get(cache_key)
-    if cached_products:
-        products, total_pages, total_count = cached_products
-        if products is None or page > total_pages:
-            return JsonResponse({'error':f'Invalid page number, total pages {total_pages}'})
-    else:
-        products_list = list(qs.values('product_id', 'name', 'price', 'stock', 'rating', 'category__name'))
-        products, total_pages = pagination_helper(products_list, page)
-        total_count = len(products_list)
-        cache.set(cache_key, (products, total_pages, total_count), timeout=300)
-    if products is None or page > total_pages:
-        return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
-
-    return {
-        'your_products': list(products),
-        'current_page': page,
-        'total_pages': total_pages,
-        'total_products': total_count
-    }
-
+    return run_listing(product_listing(request, user), request)
 
 @csrf_exempt
 @timed_response
@@ -497,7 +457,7 @@ def expensive_products(request):
     if category_name:
         qs = qs.filter(category__name__iexact=category_name)
     if search_name:
-        qs = qs.filter(name__icontains=search_name)
+        qs = qs.filter(id__in=matching_products(search_name))
     if min_price is not None:
         qs = qs.filter(price__gte=min_price)
     if max_price is not None:
@@ -518,29 +478,18 @@ def expensive_products(request):
         'created_at': '-created_at',
         }
     order_by = sort_mapping.get(sort_by, '-created_at')
-    qs = qs.order_by(order_by)
+    qs = qs.order_by(order_by, '-id')
 
-    cache_key = (
+    cache_key = versioned_key(
         f'products_user_{user.id}_cat_{category_name}_search_{search_name}_'
-        f'sort_{order_by}_min_{min_price}_max_{max_price}_exp_{expensive}_page_{page}'
+        f'sort_{order_by}_min_{min_price}_max_{max_price}_exp_{expensive}_page_{page}',
+        shopkeeper_products(user.id)
     )
-    cached_data = cache.get(cache_key)
-
-    if cached_data:
-        print('Cache Hit')
-        products, total_pages, total_count = cached_data
-        if products is None or page > total_pages:
-            return JsonResponse({'error':f'Invalid page number, total pages {total_pages}'})
-    else:
-        print('Cache Miss')
-        products_list = list(qs.values(
-            'product_id', 'name', 'price', 'discount_price', 'stock', 'rating', 'category__name'
-        ))
-        products, total_pages = pagination_helper(products_list, page)
-        if products is None or page > total_pages:
-            return JsonResponse({'error':f'Invalid page number, total pages {total_pages}'}) 
-        total_count = len(products_list)
-        cache.set(cache_key, (products, total_pages, total_count), timeout=300)
+    products, total_pages, total_count = cached_call(cache_key, lambda: priced_page(qs, (
+        'product_id', 'name', 'price', 'discount_price', 'stock', 'rating', 'category__name'
+    ), page), price_cache_timeout(settings.CACHE_TTL), stale=False)
+    if products is None or page > total_pages:
+        return JsonResponse({'error':f'Invalid page number, total pages {total_pages}'})
 
     return {
         'your_products': list(products),
@@ -573,23 +522,13 @@ def low_stock_products(request):
     except ValueError:
         min_stock = 10
 
-    cache_key = f'low_stock_user_{user.id}_max_{min_stock}_page_{page}'
-    cached_data = cache.get(cache_key)
-
-    if cached_data:
-        print("Cache hit")
-        products, total_pages, total_count = cached_data
-        if products is None or page>total_pages:
-            return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
-    else:
-        print("Cache miss")
-        qs = Products.objects.filter(created_by=user, stock__lte=min_stock)
-        products_list = list(qs.values('product_id', 'name', 'stock', 'category__name'))
-        products, total_pages = pagination_helper(products_list, page)
-        if products is None or page>total_pages:
-            return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
-        total_count = len(products_list)
-        cache.set(cache_key, (products, total_pages, total_count), timeout=300)
+    cache_key = versioned_key(f'low_stock_user_{user.id}_max_{min_stock}_page_{page}', shopkeeper_products(user.id))
+    qs = Products.objects.filter(created_by=user, stock__lte=min_stock).order_by('stock', 'id')
+    products, total_pages, total_count = cached_call(cache_key, lambda: paginate_queryset(
+        qs.values('product_id', 'name', 'stock', 'category__name'), page
+    ), settings.CACHE_TTL)
+    if products is None or page>total_pages:
+        return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
 
     if not products:
         return {
@@ -623,6 +562,7 @@ def top_selling_products(request):
     search_name = request.GET.get('search', '').strip()
     sort_by = request.GET.get('sort', 'total_sold')
     top_n = request.GET.get('top_n', 10)
+    period = request.GET.get('period', None)
 
     try:
         page = max(int(page), 1)
@@ -633,56 +573,57 @@ def top_selling_products(request):
     except ValueError:
         top_n = 10
 
-    qs = Orders.objects.filter(product__created_by=user)
+    # sales counters are maintained on order placement, so this is an indexed
+    # ORDER BY on Products (all time) or on the current day/week rollup rows
+    if period in PERIODS:
+        bucket = bucket_start(period, timezone.now())
+        qs = SalesRollups.objects.filter(product__created_by=user, period=period, bucket=bucket, units__gt=0)
+        prefix, sold = 'product__', 'units'
+    else:
+        period, bucket = None, None
+        qs = Products.objects.filter(created_by=user, total_sold__gt=0)
+        prefix, sold = '', 'total_sold'
 
     if category_name:
-        qs = qs.filter(product__category__name__iexact=category_name)
+        qs = qs.filter(**{f'{prefix}category__name__iexact': category_name})
     if search_name:
-        qs = qs.filter(product__name__icontains=search_name)
-
-    qs = qs.values(
-        'product_id',
-        'product__name',
-        'product__price',
-        'product__stock',
-        'product__category__name'
-    ).annotate(total_sold=Sum('quantity'))
+        qs = qs.filter(**{f'{prefix}id__in': matching_products(search_name)})
+
+    response_fields = {
+        f'{prefix}id': 'product_id',
+        f'{prefix}name': 'product__name',
+        f'{prefix}price': 'product__price',
+        f'{prefix}stock': 'product__stock',
+        f'{prefix}category__name': 'product__category__name',
+        sold: 'total_sold',
+    }
 
     sort_mapping = {
-        'total_sold': '-total_sold',
-        'name': 'product__name',
-        'price_asc': 'product__price',
-        'price_desc': '-product__price',
-        'stock': '-product__stock'
+        'total_sold': f'-{sold}',
+        'name': f'{prefix}name',
+        'price_asc': f'{prefix}price',
+        'price_desc': f'-{prefix}price',
+        'stock': f'-{prefix}stock'
     }
-    order_by = sort_mapping.get(sort_by, '-total_sold')
-    qs = qs.order_by(order_by)
+    order_by = sort_mapping.get(sort_by, f'-{sold}')
+    qs = qs.order_by(order_by, '-id').values(*response_fields)
     
-    cache_key = (
+    cache_key = versioned_key(
             f'top_selling_products_user_{user.id}_cat_{category_name}_search_{search_name}_'
-            f'sort_{order_by}_topn_{top_n}_page_{page}'
+            f'sort_{order_by}_topn_{top_n}_period_{period}_{bucket}_page_{page}',
+            shopkeeper_products(user.id)
         )
-        
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        print('Cache Hit')
-        requested_products, total_pages, total_count = cached_data
-        if requested_products is None or page>total_pages:
-            return JsonResponse({'error':f'Invalid page number, total pages are {total_pages}'})
 
-    else:
-        print('Cache Miss')
-        products_list = list(qs[:top_n])
-        total_count = len(products_list)
+    def load_top_selling():
+        products_list = [{response_fields[key]: value for key, value in row.items()} for row in qs[:top_n]]
         requested_products, total_pages = pagination_helper(products_list, page)
-    
-        if not requested_products:
-            return JsonResponse({
-                'error': f'No products found or Invalid page number, total pages {total_pages}'
-            }, status=404)
+        return requested_products, total_pages, len(products_list)
 
-        
-        cache.set(cache_key, (requested_products, total_pages, total_count), timeout=300)
+    requested_products, total_pages, total_count = cached_call(cache_key, load_top_selling, settings.CACHE_TTL)
+    if not requested_products:
+        return JsonResponse({
+            'error': f'No products found or Invalid page number, total pages {total_pages}'
+        }, status=404)
 
     return {
         'top_selling_products': list(requested_products),
@@ -693,6 +634,81 @@ def top_selling_products(request):
     }
 
 
+# granularity -> (rollup period it is read from, default range in days, max range in days)
+DASHBOARD_GRANULARITIES = {
+    'hour': ('hour', 2, 31),
+    'day': ('day', 30, 366),
+    'week': ('week', 84, 731),
+    'month': ('day', 365, 1096),
+}
+
+
+@csrf_exempt
+@timed_response
+def sales_dashboard(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_shopkeeper(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in DASHBOARD_GRANULARITIES:
+        return JsonResponse({'error': f'granularity must be one of {", ".join(DASHBOARD_GRANULARITIES)}'}, status=400)
+    period, default_days, max_days = DASHBOARD_GRANULARITIES[granularity]
+
+    date_to = request.GET.get('to')
+    date_from = request.GET.get('from')
+    try:
+        date_to = parse_date(date_to) if date_to else timezone.localdate()
+        date_from = parse_date(date_from) if date_from else date_to - timedelta(days=default_days - 1)
+    except ValueError:
+        date_to = date_from = None
+    if not date_to or not date_from:
+        return JsonResponse({'error': 'from and to must be dates in YYYY-MM-DD format'}, status=400)
+    if date_from > date_to:
+        return JsonResponse({'error': 'from must not be after to'}, status=400)
+    if (date_to - date_from).days >= max_days:
+        return JsonResponse({'error': f'At most {max_days} days can be requested per {granularity}'}, status=400)
+
+    product_id = request.GET.get('product_id', '').strip()
+
+    # only the precomputed rollups are read, never Orders
+    start = bucket_start(period, timezone.make_aware(datetime.combine(date_from, time.min)))
+    end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    qs = SalesRollups.objects.filter(shopkeeper=user, period=period, bucket__gte=start, bucket__lt=end)
+    if product_id:
+        qs = qs.filter(product__product_id=product_id)
+    if granularity == 'month':
+        qs = qs.annotate(start=TruncMonth('bucket'))
+    else:
+        qs = qs.annotate(start=F('bucket'))
+    qs = qs.values('start').annotate(units=Sum('units'), revenue=Sum('revenue')).order_by('start')
+
+    cache_key = versioned_key(
+        f'sales_dashboard_user_{user.id}_{granularity}_{date_from}_{date_to}_product_{product_id}',
+        shopkeeper_products(user.id)
+    )
+
+    def load_dashboard():
+        return [
+            {'bucket': timezone.localtime(row['start']), 'units': row['units'], 'revenue': row['revenue']}
+            for row in qs
+        ]
+
+    buckets = cached_call(cache_key, load_dashboard, settings.CACHE_TTL)
+
+    return {
+        'granularity': granularity,
+        'from': date_from,
+        'to': date_to,
+        'buckets': buckets,
+        'total_units': sum(row['units'] for row in buckets),
+        'total_revenue': sum(row['revenue'] for row in buckets),
+    }
+
+
 @csrf_exempt
 @timed_response
 def place_order(request):
@@ -720,37 +736,94 @@ def place_order(request):
     if not product_name:
         return JsonResponse({'error': 'Product name is required'}, status=400)
 
+    if quantity < 1:
+        return JsonResponse({'error': 'Quantity must be at least 1'}, status=400)
+
     try:
-        product = Products.objects.get(name__iexact=product_name)
+        product = Products.objects.only('id', 'name', 'price', 'discount_price', 'created_by_id').get(name__iexact=product_name)
     except Products.DoesNotExist:
         return JsonResponse({'error': f'Product "{product_name}" not found'}, status=404)
-    
-    if product.stock < quantity:
-        return JsonResponse({'error': 'Not enough stock', 'available_stock': product.stock}, status=400)
 
-    order_id = f"ORD-{uuid.uuid4().hex[:10].upper()}"
-    
-    order = Orders.objects.create(
-        order_id = order_id,
-        customer=user,
-        product=product,
-        quantity=quantity,
-        order_date=timezone.now()
-    )
+    try:
+        order = place_single_order(user, product, quantity)
+    except OutOfStock:
+        available_stock = Products.objects.filter(pk=product.pk).values_list('stock', flat=True).first()
+        return JsonResponse({'error': 'Not enough stock', 'available_stock': available_stock}, status=409)
 
-    product.stock -= quantity
-    product.save(update_fields=['stock'])
+    remaining_stock = Products.objects.filter(pk=product.pk).values_list('stock', flat=True).first()
 
     return {
-        'order_id': order_id,
+        'order_id': order.order_id,
         'product': product.name,
         'quantity': quantity,
-        'remaining_stock': product.stock,
+        'unit_price': order.unit_price,
+        'total_amount': order.unit_price * quantity,
+        'remaining_stock': remaining_stock,
         'customer': user.username,
         'order_date': order.order_date
     }
 
 
+MAX_ORDER_LINES = 100
+
+
+@csrf_exempt
+@timed_response
+def place_bulk_order(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    try:
+        data = json.loads(request.body)
+        lines = [(str(line['product_id']), int(line.get('quantity', 1))) for line in data.get('lines', [])]
+        all_or_nothing = bool(data.get('all_or_nothing', False))
+    except:
+        return JsonResponse({'error': 'Invalid JSON or missing parameters'}, status=400)
+
+    if not lines:
+        return JsonResponse({'error': 'At least one order line is required'}, status=400)
+    if len(lines) > MAX_ORDER_LINES:
+        return JsonResponse({'error': f'At most {MAX_ORDER_LINES} order lines are allowed'}, status=400)
+    if any(quantity < 1 for _, quantity in lines):
+        return JsonResponse({'error': 'Quantity must be at least 1'}, status=400)
+
+    products = Products.objects.only('id', 'product_id', 'name', 'price', 'discount_price', 'created_by_id').in_bulk(
+        {product_id for product_id, _ in lines}, field_name='product_id'
+    )
+
+    found = [index for index, (product_id, _) in enumerate(lines) if product_id in products]
+    outcomes = [{'status': 'not_found'} for _ in lines]
+
+    if all_or_nothing and len(found) != len(lines):
+        for index in found:
+            outcomes[index] = {'status': 'skipped'}
+    elif found:
+        _, placed_outcomes = place_order_lines(
+            user, [(products[lines[i][0]], lines[i][1]) for i in found], all_or_nothing
+        )
+        for index, outcome in zip(found, placed_outcomes):
+            outcomes[index] = outcome
+
+    for (product_id, quantity), outcome in zip(lines, outcomes):
+        outcome['product_id'] = product_id
+        outcome['quantity'] = quantity
+
+    placed_count = sum(1 for outcome in outcomes if outcome['status'] == 'placed')
+    if not placed_count:
+        return JsonResponse({'error': 'No orders were placed', 'lines': outcomes}, status=409)
+
+    return {
+        'lines': outcomes,
+        'placed': placed_count,
+        'failed': len(outcomes) - placed_count,
+        'customer': user.username
+    }
+
+
 @csrf_exempt
 @timed_response
 def my_orders(request):
@@ -761,74 +834,210 @@ def my_orders(request):
     if not user:
         return JsonResponse({'error': 'Unauthorized'}, status=401)
 
-    page = request.GET.get('page', 1)
-    date_from = request.GET.get('date_from', None)
-    date_to = request.GET.get('date_to', None)
-    sort_by = request.GET.get('sort', 'order_date')
+    return run_listing(my_orders_listing(request, user), request)
+
+@csrf_exempt
+@timed_response
+def recent_orders(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return run_listing(recent_orders_listing(request, user), request)
+
+@csrf_exempt
+@timed_response
+def orders_today(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return run_listing(orders_today_listing(request, user), request)
+
+def _cart_cache_key(user):
+    # line prices include promotions, a promotion change makes the old snapshot unreachable
+    return versioned_key(f'cart_customer_{user.id}', PROMOTIONS)
+
+
+def _get_cart(user):
+    cart = Carts.objects.filter(customer=user).order_by('id').only('id').first()
+    if not cart:
+        cart = Carts.objects.create(customer=user)
+    return cart
+
+
+def _cart_snapshot(user):
+    cache_key = _cart_cache_key(user)
+    snapshot = cache.get(cache_key)
+    if snapshot is None:
+        items = list(CartItems.objects.filter(cart__customer=user).order_by('id').values(
+            'product__id', 'product__product_id', 'product__name', 'product__price', 'product__discount_price', 'quantity'
+        ))
+        prices = current_index()
+        now = timezone.now().timestamp()
+        for item in items:
+            discount = prices.discount(item.pop('product__id'), now)
+            item['unit_price'] = effective_price(item['product__price'], item.pop('product__discount_price'), discount)
+            item['line_total'] = item['unit_price'] * item['quantity']
+        snapshot = {
+            'items': items,
+            'total_items': sum(item['quantity'] for item in items),
+            'total_amount': sum((item['line_total'] for item in items), 0)
+        }
+        cache.set(cache_key, snapshot, timeout=price_cache_timeout(settings.CACHE_TTL))
+    return snapshot
+
+
+def _cart_request(request):
+    if request.method != 'POST':
+        return None, None, JsonResponse({'error': 'POST method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return None, None, JsonResponse({'error': 'Unauthorized'}, status=401)
 
     try:
-        page = max(int(page), 1)
-    except ValueError:
-        page = 1
+        data = json.loads(request.body) if request.body else {}
+    except:
+        return None, None, JsonResponse({'error': 'Invalid JSON'}, status=400)
+    return user, data, None
 
-    qs = Orders.objects.filter(customer=user).select_related('product')
 
-    if date_from:
-        try:
-            qs = qs.filter(order_date__gte=date_from)
-        except:
-            pass
-    if date_to:
+@csrf_exempt
+@timed_response
+def view_cart(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    return {'cart': _cart_snapshot(user)}
+
+
+@csrf_exempt
+@timed_response
+def add_to_cart(request):
+    user, data, error = _cart_request(request)
+    if error:
+        return error
+
+    try:
+        product_id = str(data['product_id'])
+        quantity = int(data.get('quantity', 1))
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'product_id and a valid quantity are required'}, status=400)
+    if quantity < 1:
+        return JsonResponse({'error': 'Quantity must be at least 1'}, status=400)
+
+    product = Products.objects.filter(product_id=product_id).only('id').first()
+    if not product:
+        return JsonResponse({'error': f'Product "{product_id}" not found'}, status=404)
+
+    cart = _get_cart(user)
+    updated = CartItems.objects.filter(cart=cart, product=product).update(quantity=F('quantity') + quantity)
+    if not updated:
         try:
-            qs = qs.filter(order_date__lte=date_to)
-        except:
-            pass
+            with transaction.atomic():
+                CartItems.objects.create(cart=cart, product=product, quantity=quantity)
+        except IntegrityError:
+            CartItems.objects.filter(cart=cart, product=product).update(quantity=F('quantity') + quantity)
 
-    sort_mapping = {
-        'order_date': '-order_date',
-        'quantity': '-quantity',
-        'price_asc': 'product__price',
-        'price_desc': '-product__price',
-    }
-    qs = qs.order_by(sort_mapping.get(sort_by, '-order_date'))
+    cache.delete(_cart_cache_key(user))
+    return {'cart': _cart_snapshot(user)}
 
-    cache_key = (
-        f'my_orders_user_{user.id}_date_from_{date_from}_date_to_{date_to}_sort_{sort_by}_page_{page}'
-    )
-    cached_data = cache.get(cache_key)
 
-    if cached_data:
-        print("Cache hit")
-        orders, total_pages, total_count = cached_data
-        
+@csrf_exempt
+@timed_response
+def update_cart(request):
+    user, data, error = _cart_request(request)
+    if error:
+        return error
+
+    try:
+        product_id = str(data['product_id'])
+        quantity = int(data['quantity'])
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({'error': 'product_id and a valid quantity are required'}, status=400)
+
+    items = CartItems.objects.filter(cart__customer=user, product__product_id=product_id)
+    if quantity < 1:
+        changed = items.delete()[0]
     else:
-        print("Cache miss")
-        orders_list = list(qs.values(
-            'order_id', 
-            'product__name', 
-            'quantity', 
-            'product__price',
-            'order_date',
-            'product__category__name'
+        changed = items.update(quantity=quantity)
+    if not changed:
+        return JsonResponse({'error': f'Product "{product_id}" is not in your cart'}, status=404)
+
+    cache.delete(_cart_cache_key(user))
+    return {'cart': _cart_snapshot(user)}
+
+
+@csrf_exempt
+@timed_response
+def remove_from_cart(request):
+    user, data, error = _cart_request(request)
+    if error:
+        return error
+
+    product_id = data.get('product_id')
+    if not product_id:
+        return JsonResponse({'error': 'product_id is required'}, status=400)
+
+    if not CartItems.objects.filter(cart__customer=user, product__product_id=product_id).delete()[0]:
+        return JsonResponse({'error': f'Product "{product_id}" is not in your cart'}, status=404)
+
+    cache.delete(_cart_cache_key(user))
+    return {'cart': _cart_snapshot(user)}
+
+
+@csrf_exempt
+@timed_response
+def checkout_cart(request):
+    user, _, error = _cart_request(request)
+    if error:
+        return error
+
+    carts = list(Carts.objects.filter(customer=user).prefetch_related(
+        Prefetch('items', queryset=CartItems.objects.select_related('product').only(
+            'id', 'cart_id', 'quantity', 'product__id', 'product__product_id', 'product__name', 'product__price',
+            'product__discount_price', 'product__created_by_id'
         ))
-        orders, total_pages = pagination_helper(orders_list, page)
-        total_count = len(orders_list)
-        cache.set(cache_key, (orders, total_pages, total_count), timeout=300)
+    ))
+    items = [item for cart in carts for item in cart.items.all()]
+    if not items:
+        return JsonResponse({'error': 'Your cart is empty'}, status=400)
+
+    with transaction.atomic():
+        orders, outcomes = place_order_lines(user, [(item.product, item.quantity) for item in items], all_or_nothing=True)
+        if orders:
+            CartItems.objects.filter(id__in=[item.id for item in items]).delete()
+
+    for item, outcome in zip(items, outcomes):
+        outcome['product_id'] = item.product.product_id
+        outcome['quantity'] = item.quantity
 
     if not orders:
-        return JsonResponse({'error': f'No orders found or invalid page number, total pages are {total_pages}'}, status=404)
+        return JsonResponse({'error': 'Checkout failed, nothing was ordered', 'lines': outcomes}, status=409)
 
+    cache.delete(_cart_cache_key(user))
     return {
-        'my_orders': list(orders),
-        'current_page': page,   
-        'total_pages': total_pages,
-        'total_orders': total_count
+        'lines': outcomes,
+        'total_items': sum(item.quantity for item in items),
+        'total_amount': sum(order.unit_price * order.quantity for order in orders),
+        'customer': user.username
     }
 
 
 @csrf_exempt
 @timed_response
-def recent_orders(request):
+def list_notifications(request):
     if request.method != 'GET':
         return JsonResponse({'error': 'GET method required'}, status=405)
 
@@ -836,99 +1045,233 @@ def recent_orders(request):
     if not user:
         return JsonResponse({'error': 'Unauthorized'}, status=401)
 
-    page = request.GET.get('page', 1)
-    sort_by = request.GET.get('sort', 'order_date') 
+    qs = Notifications.objects.filter(customer=user)
+    if request.GET.get('unread') in ('1', 'true'):
+        qs = qs.filter(read=False)
 
     try:
-        page = max(int(page), 1)
-    except ValueError:
-        page = 1
-
-    two_weeks_ago = timezone.now() - timedelta(days=14)
-    qs = Orders.objects.filter(customer=user, order_date__gte= two_weeks_ago).select_related('product')
+        notifications, next_cursor, _ = keyset_paginate(
+            qs, ('id', 'message', 'read', 'created_at'), {'newest': '-created_at'}, 'newest',
+            request.GET.get('cursor', '')
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
-    sort_mapping = {
-        'order_date': '-order_date',
-        'quantity': '-quantity',
-        'price_asc': 'product__price',
-        'price_desc': '-product__price',
+    return {
+        'notifications': notifications,
+        'next_cursor': next_cursor,
+        'unread_count': unread_count(user.id)
     }
-    qs = qs.order_by(sort_mapping.get(sort_by, '-order_date'))
 
-    cache_key = f'recent_orders_user_{user.id}_sort_{sort_by}_page_{page}'
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        print("Cache hit")
-        orders, total_pages, total_count = cached_data
-    else:
-        print("Cache miss")
-        orders_list = list(qs.values(
-            'id', 'product__name', 'product__category__name', 'quantity', 'order_date', 'product__price'
-        ))
-        orders, total_pages = pagination_helper(orders_list, page)
-        total_count = len(orders_list)
-        cache.set(cache_key, (orders, total_pages, total_count), timeout=300)
 
-    if not orders:
-        return JsonResponse({'error': f'No orders found or invalid page number, total pages are {total_pages}'}, status=404)
+@csrf_exempt
+@timed_response
+def notifications_unread_count(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
 
+    return {'unread_count': unread_count(user.id)}
+
+
+MAX_MARK_READ_IDS = 1000
+
+
+@csrf_exempt
+@timed_response
+def mark_notifications_read(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    try:
+        data = json.loads(request.body) if request.body else {}
+    except:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    ids = data.get('ids')
+    if ids is None and not data.get('all'):
+        return JsonResponse({'error': 'Send ids or all=true'}, status=400)
+    if ids is not None:
+        if not isinstance(ids, list) or len(ids) > MAX_MARK_READ_IDS:
+            return JsonResponse({'error': f'ids must be a list of at most {MAX_MARK_READ_IDS} notification ids'}, status=400)
+        try:
+            ids = [int(notification_id) for notification_id in ids]
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'ids must be integers'}, status=400)
+
+    updated = mark_read(user.id, ids)
     return {
-        'recent_orders': list(orders),
-        'current_page': page,
-        'total_pages': total_pages,
-        'total_orders': total_count
+        'marked_read': updated,
+        'unread_count': unread_count(user.id)
     }
 
 
 @csrf_exempt
 @timed_response
-def orders_today(request):
+def view_cache_stats(request):
     if request.method != 'GET':
         return JsonResponse({'error': 'GET method required'}, status=405)
 
+    if not _authorize_superuser(request):
+        return JsonResponse({'error': 'Only superuser can view cache stats'}, status=403)
+
+    # counters of the process that served this request, not the whole cluster
+    return cache_stats()
+
+
+@csrf_exempt
+@timed_response
+def broadcast_notification(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+
+    user = _authorize_superuser(request)
+    if not user:
+        return JsonResponse({'error': 'Only superuser can send notifications'}, status=403)
+
+    try:
+        data = json.loads(request.body)
+    except:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    message = (data.get('message') or '').strip()
+    customer_ids = data.get('customer_ids')
+    if not message:
+        return JsonResponse({'error': 'message is required'}, status=400)
+    if customer_ids is not None:
+        if not isinstance(customer_ids, list):
+            return JsonResponse({'error': 'customer_ids must be a list'}, status=400)
+        try:
+            customer_ids = [int(customer_id) for customer_id in customer_ids]
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'customer_ids must be integers'}, status=400)
+
+    fan_out_notification.delay(message, customer_ids)
+    return {
+        'queued': True,
+        'recipients': len(customer_ids) if customer_ids is not None else 'all'
+    }
+
+
+def _review_rating(value):
+    try:
+        rating = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError):
+        return None
+    return rating if 1 <= rating <= 5 else None
+
+
+@csrf_exempt
+@timed_response
+def submit_review(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+
     user = _authorize_customer(request)
     if not user:
         return JsonResponse({'error': 'Unauthorized'}, status=401)
 
-    page = request.GET.get('page', 1)
-    sort_by = request.GET.get('sort', 'order_date')
+    try:
+        data = json.loads(request.body)
+    except:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+
+    product_id = str(data.get('product_id', '')).strip()
+    rating = _review_rating(data.get('rating'))
+    comment = data.get('comment', '') or ''
+    if not product_id:
+        return JsonResponse({'error': 'product_id is required'}, status=400)
+    if rating is None:
+        return JsonResponse({'error': 'rating must be a number between 1 and 5'}, status=400)
+
+    product = Products.objects.filter(product_id=product_id).only('id').first()
+    if not product:
+        return JsonResponse({'error': 'Product not found'}, status=404)
+
+    # save()/create() (not update()) so the rating signals move the aggregates
+    review = Reviews.objects.filter(product=product, customer=user).first()
+    created = review is None
+    if created:
+        try:
+            with transaction.atomic():
+                review = Reviews.objects.create(product=product, customer=user, rating=rating, comment=comment)
+        except IntegrityError:
+            review = Reviews.objects.get(product=product, customer=user)
+            created = False
+    if not created:
+        review.rating = rating
+        review.comment = comment
+        review.save(update_fields=['rating', 'comment'])
+
+    product_rating = Products.objects.filter(pk=product.pk).values('rating', 'rating_count').first()
+    return {
+        'product_id': product_id,
+        'rating': review.rating,
+        'comment': review.comment,
+        'created': created,
+        'product_rating': product_rating['rating'],
+        'product_rating_count': product_rating['rating_count']
+    }
+
+
+@csrf_exempt
+@timed_response
+def delete_review(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+
+    user = _authorize_customer(request)
+    if not user:
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
 
     try:
-        page = max(int(page), 1)
-    except ValueError:
-        page = 1
+        data = json.loads(request.body)
+    except:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
-    today = timezone.now().date()
-    qs = Orders.objects.filter(customer=user, order_date__date=today).select_related('product')
+    review = Reviews.objects.filter(product__product_id=str(data.get('product_id', '')), customer=user).first()
+    if not review:
+        return JsonResponse({'error': 'Review not found'}, status=404)
+    review.delete()
+    return {'deleted': True}
 
-    sort_mapping = {
-        'order_date': '-order_date',
-        'quantity': '-quantity',
-        'price_asc': 'product__price',
-        'price_desc': '-product__price',
-    }
-    qs = qs.order_by(sort_mapping.get(sort_by, '-order_date'))
 
-    cache_key = f'orders_today_user_{user.id}_sort_{sort_by}_page_{page}'
-    cached_data = cache.get(cache_key)
-    if cached_data:
-        print("Cache hit")
-        orders, total_pages, total_count = cached_data
-    else:
-        print("Cache miss")
-        orders_list = list(qs.values(
-            'id', 'product__name', 'product__category__name', 'quantity', 'order_date', 'product__price'
-        ))
-        orders, total_pages = pagination_helper(orders_list, page)
-        total_count = len(orders_list)
-        cache.set(cache_key, (orders, total_pages, total_count), timeout=300)
+@csrf_exempt
+@timed_response
+def list_reviews(request):
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET method required'}, status=405)
 
-    if not orders:
-        return JsonResponse({'error': f'No orders found or invalid page number, total pages are {total_pages}'}, status=404)
+    user = _authorize_shopkeeper(request) or _authorize_customer(request) or _authorize_superuser(request)
+    if not user:
+        return JsonResponse({'error': 'You should be an authorized user'}, status=401)
+
+    product = Products.objects.filter(product_id=request.GET.get('product_id', '')).values(
+        'id', 'name', 'rating', 'rating_count'
+    ).first()
+    if not product:
+        return JsonResponse({'error': 'Product not found'}, status=404)
+
+    try:
+        reviews, next_cursor, _ = keyset_paginate(
+            Reviews.objects.filter(product_id=product['id']),
+            ('customer__username', 'rating', 'comment', 'created_at'),
+            {'newest': '-created_at'}, 'newest', request.GET.get('cursor', '')
+        )
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
 
     return {
-        'today_orders': list(orders),
-        'current_page': page,
-        'total_pages': total_pages,
-        'total_orders': total_count
-    }
\ No newline at end of file
+        'product': product['name'],
+        'rating': product['rating'],
+        'rating_count': product['rating_count'],
+        'reviews': reviews,
+        'next_cursor': next_cursor
+    }